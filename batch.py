@@ -0,0 +1,163 @@
+import numpy as np
+
+import engine
+
+# Пакетный симулятор: N партий хранятся одним массивом степеней (N, size, size).
+# Ячейка (x, y) лежит в boards[n, y, x], т.е. плоский индекс x + y * size
+# совпадает с номерами ячеек в GameView.tiles_empty.
+
+
+# Сдвиг линий (M, size) к нулевому индексу по правилам GameView.up.
+# Цикл идёт только по позиции в линии, все линии обрабатываются сразу.
+def slide_lines(lines):
+    lines = lines.copy()
+    count, size = lines.shape
+    rows = np.arange(count)
+    score = np.zeros(count, dtype=np.int64)
+    filled = (lines[:, :1] != 0).sum(axis=1)  # Уже сжатый префикс
+
+    for i in range(1, size):
+        tile = lines[:, i]
+        present = tile != 0
+        target = np.maximum(filled - 1, 0)
+        merge = present & (filled > 0) & (lines[rows, target] == tile)
+        shift = present & ~merge & (filled < i)
+
+        # Слияние с ближайшей плиткой префикса
+        merged = lines[rows[merge], target[merge]] + 1
+        lines[rows[merge], target[merge]] = merged
+        score[merge] += np.left_shift(1, merged.astype(np.int64))
+
+        # Сдвиг в первую свободную ячейку
+        lines[rows[shift], filled[shift]] = tile[shift]
+        lines[merge | shift, i] = 0
+        filled += present & ~merge
+
+    return lines, score
+
+
+# Ход для набора полей (K, size, size): (новые поля, очки)
+def move_boards(boards, direction):
+    count, size = boards.shape[0], boards.shape[1]
+
+    if direction in (engine.UP, engine.DOWN):
+        view = boards.transpose(0, 2, 1)
+    else:
+        view = boards
+    if direction in (engine.DOWN, engine.RIGHT):
+        view = view[:, :, ::-1]
+
+    lines, score = slide_lines(view.reshape(count * size, size))
+    lines = lines.reshape(count, size, size)
+
+    if direction in (engine.DOWN, engine.RIGHT):
+        lines = lines[:, :, ::-1]
+    if direction in (engine.UP, engine.DOWN):
+        lines = lines.transpose(0, 2, 1)
+
+    return np.ascontiguousarray(lines), score.reshape(count, size).sum(axis=1)
+
+
+# Есть ли доступный ход, как в GameView.tiles_available
+def moves_available(boards):
+    return (
+        (boards == 0).any(axis=(1, 2))
+        | (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2))
+        | (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2))
+    )
+
+
+class BatchGame:
+    def __init__(self, count, grid_size=4, seed=None):
+        if not engine.GRID_MIN <= grid_size <= engine.GRID_MAX:
+            raise ValueError(
+                f"Размер сетки должен быть от {engine.GRID_MIN} до {engine.GRID_MAX}"
+            )
+
+        self.count = count
+        self.grid_size = grid_size
+        self.rng = np.random.default_rng(seed)
+
+        self.boards = np.zeros((count, grid_size, grid_size), dtype=np.uint8)
+        self.scores = np.zeros(count, dtype=np.int64)
+        self.moves = np.zeros(count, dtype=np.int64)
+        self.finished = np.zeros(count, dtype=bool)  # Партия окончена
+        self.won = np.zeros(count, dtype=bool)  # Получена плитка 2048
+
+        self.reset()
+
+    # Начать заново (все партии или отмеченные маской)
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.count, dtype=bool)
+
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self.moves[mask] = 0
+        self.finished[mask] = False
+        self.won[mask] = False
+
+        self.add_tiles(mask)
+        self.add_tiles(mask)
+
+    # Создание плитки на каждом отмеченном поле, как в GameView.add_tile
+    def add_tiles(self, mask):
+        flat = self.boards.reshape(self.count, -1)
+        empty = flat == 0
+        mask = mask & empty.any(axis=1)
+
+        # Случайная пустая ячейка: максимум случайных ключей по пустым ячейкам
+        keys = self.rng.random(flat.shape)
+        keys[~empty] = -1.0
+        index = keys.argmax(axis=1)
+        exponent = np.where(self.rng.random(self.count) < 0.9, 1, 2)
+
+        rows = np.flatnonzero(mask)
+        flat[rows, index[rows]] = exponent[rows]
+
+    # Ход во всех активных партиях.
+    # directions - одно направление или массив направлений (N,)
+    def step(self, directions):
+        directions = np.broadcast_to(np.asarray(directions), (self.count,))
+        moved = np.zeros(self.count, dtype=bool)
+
+        for direction in engine.DIRECTIONS:
+            rows = np.flatnonzero((directions == direction) & ~self.finished)
+            if rows.size == 0:
+                continue
+
+            before = self.boards[rows]
+            after, score = move_boards(before, direction)
+            changed = (after != before).any(axis=(1, 2))
+
+            rows = rows[changed]
+            self.boards[rows] = after[changed]
+            self.scores[rows] += score[changed]
+            moved[rows] = True
+
+        self.moves[moved] += 1
+        self.add_tiles(moved)
+
+        self.won |= (
+            self.boards.reshape(self.count, -1).max(axis=1)
+            >= engine.WIN_EXPONENT
+        )
+        self.finished |= self.won | ~moves_available(self.boards)
+
+        return moved
+
+    # Игра до окончания всех партий.
+    # policy(game) возвращает массив направлений (N,)
+    def play(self, policy, max_steps=None):
+        steps = 0
+        while not self.finished.all():
+            if max_steps is not None and steps >= max_steps:
+                break
+            self.step(policy(self))
+            steps += 1
+        return steps
+
+
+# Случайная стратегия
+def random_policy(game):
+    return game.rng.integers(0, 4, size=game.count)
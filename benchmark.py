@@ -0,0 +1,447 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Отрисовка без экрана
+
+import engine
+import storage
+
+# Замеры производительности движка, отрисовки и истории игр.
+# Результаты пишутся в JSON, чтобы сравнивать их между коммитами:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json
+#   python benchmark.py --compare before.json after.json
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GRID_SIZES = (2, 3, 4, 5, 6, 8, 16)  # 8 и 16 - нагрузочные размеры
+DIRECTIONS = {
+    "up": engine.UP,
+    "down": engine.DOWN,
+    "left": engine.LEFT,
+    "right": engine.RIGHT,
+}
+HISTORY_ROWS = (10000, 100000, 1000000)
+SERVER_SESSIONS = 10000
+SERVER_REQUESTS = 100000
+
+
+class Benchmark:
+    def __init__(self, seed, positions):
+        self.seed = seed
+        self.positions = positions
+        self.results = []
+
+    def record(self, name, params, value, unit):
+        self.results.append(
+            {"name": name, "params": params, "value": value, "unit": unit}
+        )
+        described = ", ".join(f"{key}={value}" for key, value in params.items())
+        print(f"{name:<22} {described:<30} {value:>14.2f} {unit}")
+
+    # Позиции из случайных партий (списки степеней, индекс x + y * size)
+    def sample_positions(self, size):
+        rng = random.Random(self.seed + size)
+        rules = engine.rules(size)
+        positions = []
+
+        board = rules.new_board(rng)
+        while len(positions) < self.positions:
+            if not rules.moves_available(board):
+                board = rules.new_board(rng)
+                continue
+            positions.append(rules.to_cells(board))
+
+            moved, score = rules.move(board, rng.choice(engine.DIRECTIONS))
+            if moved != board:
+                board = rules.add_tile(moved, rng)
+
+        return positions
+
+    # Ходы движка без Qt
+    def bench_engine(self):
+        for size in GRID_SIZES:
+            rules = engine.rules(size)
+            boards = [rules.from_cells(cells) for cells in self.sample_positions(size)]
+
+            # Прогрев без замера: кэши и таблицы строк движка заполняются
+            # здесь, а не на счёт первого направления
+            for direction in DIRECTIONS.values():
+                for board in boards:
+                    rules.move(board, direction)
+
+            for name, direction in DIRECTIONS.items():
+                move = rules.move
+                started = time.perf_counter()
+                for board in boards:
+                    move(board, direction)
+                elapsed = time.perf_counter() - started
+
+                self.record(
+                    "engine.move",
+                    {"grid": size, "direction": name},
+                    len(boards) / elapsed,
+                    "moves/s",
+                )
+
+    # Ходы, update_tiles, tiles_available и paintEvent в GameView
+    def bench_view(self, view):
+        from PyQt5.QtGui import QImage, QPainter
+
+        for size in GRID_SIZES:
+            view.settings_apply(size)
+            positions = self.sample_positions(size)
+            view.rng.seed(self.seed)  # Плитки после ходов - из генератора GameView
+
+            for name in DIRECTIONS:
+                method = getattr(view, name)
+                elapsed = 0.0
+                for cells in positions:
+                    load_position(view, cells)
+                    started = time.perf_counter()
+                    method()
+                    elapsed += time.perf_counter() - started
+
+                self.record(
+                    "view.move",
+                    {"grid": size, "direction": name},
+                    len(positions) / elapsed,
+                    "moves/s",
+                )
+
+            for name in ("update_tiles", "tiles_available"):
+                method = getattr(view, name)
+                elapsed = 0.0
+                for cells in positions:
+                    load_position(view, cells)
+                    started = time.perf_counter()
+                    method()
+                    elapsed += time.perf_counter() - started
+
+                self.record(
+                    f"view.{name}",
+                    {"grid": size},
+                    elapsed / len(positions) * 1e6,
+                    "us/call",
+                )
+
+            # Кадр рисуется в изображение, вызывая paintEvent
+            image = QImage(view.size(), QImage.Format_ARGB32_Premultiplied)
+            frames = positions[: max(1, len(positions) // 10)]
+            elapsed = 0.0
+            for cells in frames:
+                load_position(view, cells)
+                painter = QPainter(image)
+                started = time.perf_counter()
+                view.render(painter)
+                elapsed += time.perf_counter() - started
+                painter.end()
+
+            self.record(
+                "view.paintEvent",
+                {"grid": size},
+                elapsed / len(frames) * 1e3,
+                "ms/frame",
+            )
+
+    # Построение вкладки "История игр" для разного числа записей
+    def bench_history(self, game, rows_counts):
+        rng = random.Random(self.seed)
+
+        for rows in rows_counts:
+            game.storage.clear()
+            game.storage.add_games(
+                (
+                    rng.choice((storage.WIN, storage.LOSS)),
+                    rng.randrange(20000),
+                    -1,
+                    storage.now(),
+                    rng.choice(GRID_SIZES),
+                )
+                for _ in range(rows)
+            )
+
+            started = time.perf_counter()
+            game.data_history()
+            self.record(
+                "history.data_history",
+                {"rows": rows},
+                (time.perf_counter() - started) * 1e3,
+                "ms",
+            )
+
+            # Вкладка создаёт модель, строки читаются отдельно
+            started = time.perf_counter()
+            widget = game.history_game()
+            self.record(
+                "history.history_game",
+                {"rows": rows},
+                (time.perf_counter() - started) * 1e3,
+                "ms",
+            )
+            widget.deleteLater()
+
+            started = time.perf_counter()
+            game.history_model.reload()
+            self.record(
+                "history.model_reload",
+                {"rows": rows},
+                (time.perf_counter() - started) * 1e3,
+                "ms",
+            )
+
+            # Запись одной партии, как в конце игры: в обработчике клавиш
+            # только очередь, INSERT - в фоновом потоке
+            view = game.game_view
+            started = time.perf_counter()
+            view.update_history(view.score, storage.LOSS)
+            self.record(
+                "history.update_history",
+                {"rows": rows},
+                (time.perf_counter() - started) * 1e3,
+                "ms",
+            )
+            view.history_saver.flush()
+            self.record(
+                "history.save_background",
+                {"rows": rows},
+                (time.perf_counter() - started) * 1e3,
+                "ms",
+            )
+
+    # Игровой сервер: запросы пачками по одному соединению, как у ботов.
+    # Клиент работает в том же процессе, поэтому число - нижняя оценка
+    def bench_server(self, sessions, requests):
+        import asyncio
+        import server
+
+        rng = random.Random(self.seed)
+        names = list(DIRECTIONS)
+
+        async def exchange(reader, writer, lines):
+            writer.write(b"".join(lines))
+            for _ in lines:
+                await reader.readline()
+
+        async def load():
+            game_server = server.GameServer(seed=self.seed)
+            listener = await game_server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection(server.HOST, port)
+
+            new = json.dumps({"op": "new", "size": 4}).encode() + b"\n"
+            await exchange(reader, writer, [new] * sessions)
+
+            lines = [
+                json.dumps(
+                    {
+                        "op": "move",
+                        "id": rng.randrange(sessions) + 1,
+                        "direction": rng.choice(names),
+                    }
+                ).encode()
+                + b"\n"
+                for _ in range(requests)
+            ]
+            started = time.perf_counter()
+            for start in range(0, requests, 1000):
+                await exchange(reader, writer, lines[start : start + 1000])
+            elapsed = time.perf_counter() - started
+
+            # Обработчик соединения должен увидеть конец потока и завершиться
+            # до asyncio.run, иначе его отмена печатает CancelledError
+            writer.close()
+            await writer.wait_closed()
+            listener.close()
+            await listener.wait_closed()
+            game_server.close()
+            return elapsed
+
+        elapsed = asyncio.run(load())
+        self.record(
+            "server.move",
+            {"sessions": sessions},
+            requests / elapsed,
+            "requests/s",
+        )
+
+    # Холодный запуск программы: python main.py --startup-time
+    # в отдельном процессе, медиана по нескольким запускам
+    def bench_startup(self, runs):
+        phases = {}
+        for _ in range(runs):
+            output = subprocess.check_output(
+                [sys.executable, os.path.join(ROOT, "main.py"), "--startup-time"],
+                text=True,
+                stderr=subprocess.DEVNULL,
+            )
+            for name, ms in json.loads(output.splitlines()[-1]).items():
+                phases.setdefault(name, []).append(ms)
+
+        for name, values in phases.items():
+            values.sort()
+            self.record(
+                f"startup.{name}", {"runs": runs}, values[len(values) // 2], "ms"
+            )
+
+
+# Загрузка позиции в GameView
+def load_position(view, cells):
+    from main import Tile
+
+    size = view.grid_size
+    view.tiles = [
+        [
+            Tile(1 << cells[x + y * size]) if cells[x + y * size] else None
+            for y in range(size)
+        ]
+        for x in range(size)
+    ]
+    view.rebuild_index()
+    view.score = 0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    benchmark = Benchmark(args.seed, args.positions)
+
+    # Данные игры создаются во временном каталоге
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "files"))
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            sys.path.insert(0, ROOT)
+            import main
+
+            # Модальные окна конца игры не должны останавливать замер
+            QMessageBox.information = lambda *args: None
+
+            if "startup" in args.only:
+                benchmark.bench_startup(args.startup_runs)
+            if "engine" in args.only:
+                benchmark.bench_engine()
+            if "server" in args.only:
+                benchmark.bench_server(SERVER_SESSIONS, SERVER_REQUESTS)
+
+            game = main.Game()
+            game.show()
+            app.processEvents()
+
+            if "view" in args.only:
+                benchmark.bench_view(game.game_view)
+            if "history" in args.only:
+                benchmark.bench_history(game, args.history_rows)
+
+            game.close_connection()
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "positions": args.positions,
+        "results": benchmark.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты записаны в {args.output}")
+
+
+# Единица, для которой больше - лучше
+def higher_is_better(unit):
+    return unit.endswith("/s")
+
+
+# Сравнение двух отчётов: код возврата 1 при замедлении сверх порога
+def compare(old_path, new_path, threshold):
+    with open(old_path, encoding="utf-8") as file:
+        old = json.load(file)
+    with open(new_path, encoding="utf-8") as file:
+        new = json.load(file)
+
+    def key(result):
+        return result["name"], json.dumps(result["params"], sort_keys=True)
+
+    baseline = {key(result): result for result in old["results"]}
+    regressions = 0
+
+    for result in new["results"]:
+        previous = baseline.get(key(result))
+        if previous is None or not previous["value"]:
+            continue
+
+        ratio = result["value"] / previous["value"]
+        speedup = ratio if higher_is_better(result["unit"]) else 1 / ratio
+        flag = ""
+        if speedup < 1 - threshold:
+            flag = "  <-- замедление"
+            regressions += 1
+
+        described = ", ".join(
+            f"{name}={value}" for name, value in result["params"].items()
+        )
+        print(f"{result['name']:<22} {described:<30} x{speedup:>7.2f}{flag}")
+
+    return 1 if regressions else 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Замеры производительности 2048")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--seed", type=int, default=2048)
+    parser.add_argument(
+        "--positions", type=int, default=2000,
+        help="позиций на каждый размер поля",
+    )
+    parser.add_argument(
+        "--history-rows", nargs="+", type=int, default=list(HISTORY_ROWS)
+    )
+    parser.add_argument(
+        "--only", nargs="+",
+        default=["startup", "engine", "server", "view", "history"],
+        choices=["startup", "engine", "server", "view", "history"],
+    )
+    parser.add_argument(
+        "--startup-runs", type=int, default=5,
+        help="запусков программы для замера старта",
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"),
+        help="сравнить два отчёта вместо замера",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="допустимое замедление при сравнении (доля)",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    run(args)
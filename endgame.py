@@ -0,0 +1,497 @@
+import os
+import sys
+import mmap
+import time
+import array
+import heapq
+import bisect
+import struct
+import argparse
+import multiprocessing
+
+import engine
+from solver import SPAWNS
+
+# Точное решение полей 2x2 и 3x3: для каждой достижимой позиции -
+# вероятность собрать плитку 2 ** goal при лучшей игре и лучший ход.
+#
+# Позиция упакована по 4 бита на ячейку (ячейка x + y * size - биты
+# 4 * (x + y * size)), из 8 поворотов и отражений хранится наименьший ключ.
+# Каждый ход добавляет плитку 2 или 4, поэтому сумма плиток растёт и
+# позиции раскладываются по слоям суммы: прямой проход перечисляет слои
+# по возрастанию, обратный считает вероятности от последнего слоя к первому.
+# Слой делится на задачи для пула процессов, каждый готовый слой пишется
+# в каталог сборки, поэтому прерванная сборка продолжается с того же места.
+#
+# Итоговый файл: заголовок, отсортированные ключи uint64, вероятности
+# float32 и ходы uint8 (little-endian). Он отображается в память, поиск -
+# bisect прямо по memoryview без копирования.
+#
+#   python endgame.py build --size 3
+#   python endgame.py info --size 3
+
+PATH = "files/endgame_{size}.bin"
+BUILD_PATH = "files/endgame_{size}.build"
+MAGIC = b"EG48"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBQ")  # Метка, версия, размер поля, цель, позиций
+GOALS = {2: 5, 3: 8}  # Степень плитки-цели; 32 - наибольшая плитка на 2x2
+FIRST = 4  # Сумма плиток в начале партии: две двойки
+NO_MOVE = 255  # Ходов нет или цель уже собрана
+CHUNK = 2048  # Позиций в одной задаче пула
+TRANSPOSE = 4  # Симметрия, меняющая строки и столбцы
+
+# Направление хода -> (dx, dy)
+VECTORS = {
+    engine.UP: (0, -1),
+    engine.DOWN: (0, 1),
+    engine.LEFT: (-1, 0),
+    engine.RIGHT: (1, 0),
+}
+
+
+# Точка после поворота или отражения поля, как ntuple.transform
+def transform(x, y, variant, last):
+    if variant & 4:
+        x, y = y, x
+    if variant & 2:
+        x = last - x
+    if variant & 1:
+        y = last - y
+    return x, y
+
+
+def pack(exponents):
+    board = 0
+    for index, exponent in enumerate(exponents):
+        board |= exponent << 4 * index
+    return board
+
+
+# Ходы и симметрии упакованного поля size x size
+class Rules:
+    def __init__(self, size, goal):
+        self.size = size
+        self.goal = goal
+        self.shifts = [4 * index for index in range(size * size)]
+        self.row_shifts = [4 * size * y for y in range(size)]
+        self.row_mask = (1 << 4 * size) - 1
+
+        # Строка после сдвига влево и вправо
+        self.left = []
+        self.right = []
+        for row in range(1 << 4 * size):
+            line = [(row >> 4 * x) & 0xF for x in range(size)]
+            self.left.append(pack(engine.slide_line(line)[0]))
+            self.right.append(pack(engine.slide_line(line[::-1])[0][::-1]))
+
+        # images[вариант][y][строка] - ячейки строки y на местах в образе поля
+        last = size - 1
+        self.images = []
+        for variant in range(8):
+            tables = []
+            for y in range(size):
+                targets = [transform(x, y, variant, last) for x in range(size)]
+                tables.append(
+                    [
+                        sum(
+                            ((row >> 4 * x) & 0xF) << 4 * (tx + ty * size)
+                            for x, (tx, ty) in enumerate(targets)
+                        )
+                        for row in range(1 << 4 * size)
+                    ]
+                )
+            self.images.append(tables)
+
+        # inverse[вариант][ход в образе] - тот же ход на исходном поле
+        self.inverse = []
+        for variant in range(8):
+            mapping = {}
+            for direction, (dx, dy) in VECTORS.items():
+                image = transform(dx, dy, variant, 0)
+                for other, vector in VECTORS.items():
+                    if vector == image:
+                        mapping[other] = direction
+            self.inverse.append([mapping[d] for d in engine.DIRECTIONS])
+
+    def image(self, board, variant):
+        tables = self.images[variant]
+        mask = self.row_mask
+        result = 0
+        for y, shift in enumerate(self.row_shifts):
+            result |= tables[y][(board >> shift) & mask]
+        return result
+
+    # Наименьший образ поля и вариант симметрии, который его даёт
+    def canonical(self, board):
+        best, best_variant = board, 0
+        for variant in range(1, 8):
+            image = self.image(board, variant)
+            if image < best:
+                best, best_variant = image, variant
+        return best, best_variant
+
+    def key(self, board):
+        return self.canonical(board)[0]
+
+    def slide(self, board, table):
+        mask = self.row_mask
+        result = 0
+        for shift in self.row_shifts:
+            result |= table[(board >> shift) & mask] << shift
+        return result
+
+    # Поля после ходов, которые что-то меняют: [(направление, поле)]
+    def moves(self, board):
+        transposed = self.image(board, TRANSPOSE)
+        after = (
+            self.image(self.slide(transposed, self.left), TRANSPOSE),
+            self.image(self.slide(transposed, self.right), TRANSPOSE),
+            self.slide(board, self.left),
+            self.slide(board, self.right),
+        )
+        return [
+            (direction, moved)
+            for direction, moved in zip(engine.DIRECTIONS, after)
+            if moved != board
+        ]
+
+    def empty(self, board):
+        return [shift for shift in self.shifts if not (board >> shift) & 0xF]
+
+    def won(self, board):
+        return any((board >> shift) & 0xF >= self.goal for shift in self.shifts)
+
+    def tile_sum(self, board):
+        exponents = [(board >> shift) & 0xF for shift in self.shifts]
+        return sum(1 << exponent for exponent in exponents if exponent)
+
+    # Начальные позиции GameView.reset_game: {поле: вероятность}
+    def starts(self):
+        cells = len(self.shifts)
+        result = {}
+        for first in self.shifts:
+            for second in self.shifts:
+                if first == second:
+                    continue
+                for a, pa in SPAWNS:
+                    for b, pb in SPAWNS:
+                        board = a << first | b << second
+                        result[board] = result.get(board, 0.0) + (
+                            pa / cells * pb / (cells - 1)
+                        )
+        return result
+
+
+# Задачи пула: правила и прочитанные слои - свои в каждом процессе
+rules = None
+directory = None
+layers = {}  # Сумма плиток -> (ключи, вероятности)
+
+
+def init_worker(size, goal, build_directory):
+    global rules, directory
+    rules = Rules(size, goal)
+    directory = build_directory
+
+
+def layer_path(build_directory, total, kind):
+    return os.path.join(build_directory, f"{total:06d}.{kind}")
+
+
+def read_keys(path):
+    keys = array.array("Q")
+    with open(path, "rb") as file:
+        keys.frombytes(file.read())
+    if sys.byteorder != "little":
+        keys.byteswap()
+    return keys
+
+
+# Вероятности и ходы слоя: (array "f", bytes)
+def read_values(path, count):
+    values = array.array("f")
+    with open(path, "rb") as file:
+        values.frombytes(file.read(4 * count))
+        moves = file.read()
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values, moves
+
+
+# Запись через временный файл и переименование
+def write_atomic(path, *arrays):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        for data in arrays:
+            if isinstance(data, array.array) and sys.byteorder != "little":
+                data = array.array(data.typecode, data)
+                data.byteswap()
+            file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+# Прямой проход: ключи следующих слоёв (+2 и +4) для части слоя
+def expand_chunk(keys):
+    twos, fours = set(), set()
+    for board in array.array("Q", keys):
+        if rules.won(board):
+            continue
+        for direction, moved in rules.moves(board):
+            for shift in rules.empty(moved):
+                twos.add(rules.key(moved | 1 << shift))
+                fours.add(rules.key(moved | 2 << shift))
+    return array.array("Q", twos).tobytes(), array.array("Q", fours).tobytes()
+
+
+# Слой с вероятностями; за последним слоем позиций нет
+def next_layer(total):
+    if total not in layers:
+        path = layer_path(directory, total, "keys")
+        if os.path.exists(path):
+            keys = read_keys(path)
+            values = read_values(layer_path(directory, total, "values"), len(keys))
+            layers[total] = (keys, values[0])
+        else:
+            layers[total] = (array.array("Q"), array.array("f"))
+    return layers[total]
+
+
+# Обратный проход: вероятности и лучшие ходы для части слоя total
+def solve_chunk(task):
+    total, keys = task
+    for cached in list(layers):
+        if cached not in (total + 2, total + 4):
+            del layers[cached]
+    spawned = [
+        (exponent, probability, next_layer(total + (1 << exponent)))
+        for exponent, probability in SPAWNS
+    ]
+
+    values = array.array("f")
+    moves = bytearray()
+    for board in array.array("Q", keys):
+        best, best_move = 0.0, NO_MOVE
+        if rules.won(board):
+            best = 1.0
+        else:
+            for direction, moved in rules.moves(board):
+                empty = rules.empty(moved)
+                expected = 0.0
+                for shift in empty:
+                    for exponent, probability, (next_keys, next_values) in spawned:
+                        child = rules.key(moved | exponent << shift)
+                        expected += probability * next_values[
+                            bisect.bisect_left(next_keys, child)
+                        ]
+                expected /= len(empty)
+                if best_move == NO_MOVE or expected > best:
+                    best, best_move = expected, direction
+        values.append(best)
+        moves.append(best_move)
+    return values.tobytes(), bytes(moves)
+
+
+def chunks(keys):
+    for start in range(0, len(keys), CHUNK):
+        yield keys[start : start + CHUNK].tobytes()
+
+
+# Прямой проход: слои ключей по возрастанию суммы; возвращает последнюю сумму.
+# Прерванный проход продолжается после последнего записанного слоя: ключи
+# следующих слоёв заново получаются из двух последних
+def enumerate_layers(size_rules, build_directory, pool):
+    marker = os.path.join(build_directory, "forward")
+    if os.path.exists(marker):
+        with open(marker) as file:
+            return int(file.read())
+
+    last = FIRST - 2
+    while os.path.exists(layer_path(build_directory, last + 2, "keys")):
+        last += 2
+
+    pending = {}  # Сумма -> ключи ещё не записанного слоя
+
+    def add(total, keys):
+        if total > last:
+            pending.setdefault(total, set()).update(keys)
+
+    def expand(total, keys):
+        for twos, fours in pool.imap_unordered(expand_chunk, chunks(keys)):
+            add(total + 2, array.array("Q", twos))
+            add(total + 4, array.array("Q", fours))
+
+    for board in size_rules.starts():
+        add(size_rules.tile_sum(board), [size_rules.key(board)])
+    for total in (last - 2, last):
+        if total >= FIRST:
+            expand(total, read_keys(layer_path(build_directory, total, "keys")))
+
+    while pending:
+        last += 2
+        keys = array.array("Q", sorted(pending.pop(last, ())))
+        write_atomic(layer_path(build_directory, last, "keys"), keys)
+        print(f"Слой {last}: {len(keys)} позиций", flush=True)
+        expand(last, keys)
+
+    write_atomic(marker, str(last).encode())
+    return last
+
+
+# Обратный проход: вероятности слоёв от последнего к первому
+def solve_layers(build_directory, last, pool):
+    for total in range(last, FIRST - 2, -2):
+        path = layer_path(build_directory, total, "values")
+        if os.path.exists(path):
+            continue
+
+        keys = read_keys(layer_path(build_directory, total, "keys"))
+        values = array.array("f")
+        moves = bytearray()
+        tasks = ((total, chunk) for chunk in chunks(keys))
+        for chunk_values, chunk_moves in pool.imap(solve_chunk, tasks):
+            values.frombytes(chunk_values)
+            moves.extend(chunk_moves)
+        write_atomic(path, values, moves)
+        print(f"Слой {total}: решён", flush=True)
+
+
+# Слои в один файл, отсортированный по ключу. Ключи слоёв уже отсортированы
+# и не пересекаются, поэтому слои сливаются без общей сортировки
+def merge_layers(size, goal, build_directory, last, path):
+    streams = []
+    for total in range(FIRST, last + 2, 2):
+        keys = read_keys(layer_path(build_directory, total, "keys"))
+        values, moves = read_values(
+            layer_path(build_directory, total, "values"), len(keys)
+        )
+        streams.append(zip(keys, values, moves))
+
+    keys = array.array("Q")
+    values = array.array("f")
+    moves = bytearray()
+    for key, value, move in heapq.merge(*streams):
+        keys.append(key)
+        values.append(value)
+        moves.append(move)
+
+    write_atomic(
+        path, HEADER.pack(MAGIC, VERSION, size, goal, len(keys)), keys, values, moves
+    )
+    return len(keys)
+
+
+def build(size, goal, path=None, processes=None):
+    path = path or PATH.format(size=size)
+    build_directory = BUILD_PATH.format(size=size) + f".{goal}"
+    os.makedirs(build_directory, exist_ok=True)
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(
+        processes, initializer=init_worker, initargs=(size, goal, build_directory)
+    ) as pool:
+        last = enumerate_layers(Rules(size, goal), build_directory, pool)
+        solve_layers(build_directory, last, pool)
+    count = merge_layers(size, goal, build_directory, last, path)
+    print(
+        f"{count} позиций за {time.perf_counter() - started:.1f} с -> {path}",
+        flush=True,
+    )
+
+
+# Таблица из файла, отображённого в память
+class Database:
+    def __init__(self, rules, mapping, count):
+        self.rules = rules
+        self.mapping = mapping
+        offset = HEADER.size
+        self.keys = memoryview(mapping)[offset : offset + 8 * count].cast("Q")
+        offset += 8 * count
+        self.values = memoryview(mapping)[offset : offset + 4 * count].cast("f")
+        offset += 4 * count
+        self.moves = memoryview(mapping)[offset : offset + count]
+
+    # (лучший ход или None, вероятность собрать цель) или None, если
+    # позиции нет в таблице (например, цель уже превышена)
+    def lookup(self, board):
+        key, variant = self.rules.canonical(board)
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        move = self.moves[index]
+        direction = None if move == NO_MOVE else self.rules.inverse[variant][move]
+        return direction, self.values[index]
+
+    # То же по степеням ячеек x + y * size
+    def lookup_cells(self, cells):
+        if max(cells) > 0xF:
+            return None
+        return self.lookup(pack(cells))
+
+    # Вероятность собрать цель из начальной позиции
+    def start_probability(self):
+        return sum(
+            probability * self.lookup(board)[1]
+            for board, probability in self.rules.starts().items()
+        )
+
+    def close(self):
+        self.keys.release()
+        self.values.release()
+        self.moves.release()
+        self.mapping.close()
+
+
+def load(size, path=None):
+    path = path or PATH.format(size=size)
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("Файл таблицы обрывается")
+        magic, version, file_size, goal, count = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or file_size != size:
+            raise ValueError("Неизвестный формат файла таблицы")
+        if os.fstat(file.fileno()).st_size != HEADER.size + 13 * count:
+            raise ValueError("Размер файла таблицы не совпадает с заголовком")
+        if sys.byteorder != "little":
+            raise ValueError("Таблица читается только на little-endian")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return Database(Rules(size, goal), mapping, count)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Точное решение 2048 на 2x2 и 3x3")
+    parser.add_argument("mode", choices=["build", "info"])
+    parser.add_argument("--size", type=int, default=3, choices=sorted(GOALS))
+    parser.add_argument(
+        "--goal", type=int, default=None, help="степень плитки-цели (по умолчанию из GOALS)"
+    )
+    parser.add_argument("--path", default=None)
+    parser.add_argument(
+        "--processes", type=int, default=multiprocessing.cpu_count()
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.mode == "build":
+        goal = args.goal or GOALS[args.size]
+        if not 1 < goal <= engine.MAX_EXPONENT:
+            sys.exit(f"Цель должна быть от 2 до {engine.MAX_EXPONENT}")
+        build(args.size, goal, args.path, args.processes)
+        return
+
+    database = load(args.size, args.path)
+    print(
+        f"Поле {args.size}x{args.size}, цель {1 << database.rules.goal}: "
+        f"{len(database.keys)} позиций, "
+        f"вероятность из начала партии {database.start_probability():.2%}"
+    )
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
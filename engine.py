@@ -0,0 +1,498 @@
+import random
+from functools import lru_cache
+from operator import itemgetter
+
+# Битборд-движок для поля 4x4.
+# Поле упаковано в 64-битное число: 4 бита (степень двойки) на ячейку,
+# ячейка (x, y) хранится в полубайте с номером x + y * 4, как в tiles_empty.
+# Правила совпадают с GameView.up/down/left/right, включая начисление очков.
+
+SIZE = 4
+CELLS = SIZE * SIZE
+
+UP, DOWN, LEFT, RIGHT = range(4)  # Направления ходов
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+
+WIN_EXPONENT = 11  # 2 ** 11 = 2048
+MAX_EXPONENT = 15  # Предел 4-битной ячейки
+GRID_MIN = 2  # Размеры поля в игре (GameView.settings), на сервере и у ботов
+GRID_MAX = 16
+GRID_MAX_EXPONENT = 255  # Предел для полей-кортежей: степень помещается в байт
+
+ROW_MASK = 0xFFFF
+SHIFTS = [4 * i for i in range(CELLS)]  # Сдвиг полубайта ячейки
+# Пустые ячейки перебираются в порядке GameView.update_tiles (по столбцам)
+COLUMN_ORDER = [
+    (x + y * SIZE, 4 * (x + y * SIZE)) for x in range(SIZE) for y in range(SIZE)
+]
+
+
+# Сдвиг одной линии к нулевому индексу.
+# Повторяет цикл из GameView.up: плитка скользит до препятствия
+# и сливается с равной ей соседкой (в т.ч. только что слитой).
+def slide_line(line, limit=MAX_EXPONENT):
+    line = list(line)
+    score = 0
+
+    for i in range(1, len(line)):
+        if line[i]:
+            index = i
+
+            while index - 1 >= 0 and line[index - 1] == 0:
+                index -= 1
+            if (
+                index - 1 >= 0
+                and line[index - 1] == line[i]
+                and line[i] < limit
+            ):
+                line[index - 1] += 1
+                score += 2 ** line[index - 1]
+                line[i] = 0
+            elif index < i:
+                line[index] = line[i]
+                line[i] = 0
+
+    return line, score
+
+
+# Разворот строки (порядок полубайтов)
+def reverse_row(row):
+    return (
+        (row >> 12)
+        | ((row >> 4) & 0x00F0)
+        | ((row << 4) & 0x0F00)
+        | ((row << 12) & 0xF000)
+    )
+
+
+# Предрасчёт таблиц строк: результат хода влево/вправо и очки
+def build_tables():
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    score_left = [0] * 65536
+    score_right = [0] * 65536
+
+    for row in range(65536):
+        line = [(row >> (4 * i)) & 0xF for i in range(SIZE)]
+        moved, score = slide_line(line)
+
+        result = 0
+        for i, exponent in enumerate(moved):
+            result |= exponent << (4 * i)
+
+        row_left[row] = result
+        score_left[row] = score
+
+    for row in range(65536):
+        reverse = reverse_row(row)
+        row_right[row] = reverse_row(row_left[reverse])
+        score_right[row] = score_left[reverse]
+
+    return row_left, row_right, score_left, score_right
+
+
+ROW_LEFT = ROW_RIGHT = SCORE_LEFT = SCORE_RIGHT = None
+
+
+# Таблицы строятся при первом ходе на битборде, а не при импорте модуля:
+# это около 0.3 с, которые иначе добавляются ко времени запуска
+def load_tables():
+    global ROW_LEFT, ROW_RIGHT, SCORE_LEFT, SCORE_RIGHT
+    if ROW_LEFT is None:
+        ROW_LEFT, ROW_RIGHT, SCORE_LEFT, SCORE_RIGHT = build_tables()
+
+
+# Транспонирование поля (строки <-> столбцы)
+def transpose(board):
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+# Применение таблицы ко всем строкам
+def _move_rows(board, table, scores):
+    r0 = board & ROW_MASK
+    r1 = (board >> 16) & ROW_MASK
+    r2 = (board >> 32) & ROW_MASK
+    r3 = (board >> 48) & ROW_MASK
+    return (
+        table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48),
+        scores[r0] + scores[r1] + scores[r2] + scores[r3],
+    )
+
+
+def left(board):
+    if ROW_LEFT is None:
+        load_tables()
+    return _move_rows(board, ROW_LEFT, SCORE_LEFT)
+
+
+def right(board):
+    if ROW_LEFT is None:
+        load_tables()
+    return _move_rows(board, ROW_RIGHT, SCORE_RIGHT)
+
+
+def up(board):
+    if ROW_LEFT is None:
+        load_tables()
+    moved, score = _move_rows(transpose(board), ROW_LEFT, SCORE_LEFT)
+    return transpose(moved), score
+
+
+def down(board):
+    if ROW_LEFT is None:
+        load_tables()
+    moved, score = _move_rows(transpose(board), ROW_RIGHT, SCORE_RIGHT)
+    return transpose(moved), score
+
+
+MOVES = {UP: up, DOWN: down, LEFT: left, RIGHT: right}
+
+
+# Ход: (новое поле, полученные очки). Если поле не изменилось, ход невозможен
+def move(board, direction):
+    return MOVES[direction](board)
+
+
+# Степень двойки в ячейке
+def cell(board, index):
+    return (board >> (4 * index)) & 0xF
+
+
+# Поле из списка значений плиток (0 - пустая ячейка)
+def from_values(values):
+    board = 0
+    for index, value in enumerate(values):
+        if value:
+            board |= (value.bit_length() - 1) << (4 * index)
+    return board
+
+
+# Список значений плиток из поля
+def to_values(board):
+    return [
+        1 << exponent if exponent else 0
+        for exponent in ((board >> (4 * i)) & 0xF for i in range(CELLS))
+    ]
+
+
+# Пустые ячейки в том же порядке, что и в GameView.update_tiles
+def empty_cells(board):
+    return [index for index, shift in COLUMN_ORDER if not (board >> shift) & 0xF]
+
+
+# Создание плитки, как в GameView.add_tile
+def add_tile(board, rng=random, cells=None):
+    if cells is None:
+        cells = empty_cells(board)
+    if cells:
+        exponent = 1 if rng.random() < 0.9 else 2  # 2 => 90%, 4 => 10%
+        index = cells.pop(int(rng.random() * len(cells)))
+        board |= exponent << (4 * index)
+    return board
+
+
+# Новая игра, как в GameView.reset_game
+def new_board(rng=random):
+    cells = list(range(CELLS))
+    board = add_tile(0, rng, cells)
+    return add_tile(board, rng, cells)
+
+
+# Есть ли доступный ход
+def moves_available(board):
+    return any(move(board, direction)[0] != board for direction in DIRECTIONS)
+
+
+# Наибольшая степень на поле
+def max_exponent(board):
+    return max([(board >> shift) & 0xF for shift in SHIFTS])
+
+
+# Правила на битборде с общим интерфейсом для всех размеров поля
+class Bitboard:
+    size = SIZE
+
+    def from_cells(self, cells):
+        board = 0
+        for index, exponent in enumerate(cells):
+            board |= exponent << (4 * index)
+        return board
+
+    def to_cells(self, board):
+        return [(board >> shift) & 0xF for shift in SHIFTS]
+
+    def move(self, board, direction):
+        return MOVES[direction](board)
+
+    def empty(self, board):
+        return empty_cells(board)
+
+    def place(self, board, index, exponent):
+        return board | (exponent << (4 * index))
+
+    def add_tile(self, board, rng=random):
+        return add_tile(board, rng)
+
+    def new_board(self, rng=random):
+        return new_board(rng)
+
+    def moves_available(self, board):
+        return moves_available(board)
+
+    def max_exponent(self, board):
+        return max_exponent(board)
+
+
+# Правила для полей произвольного размера.
+# Поле - кортеж степеней, индекс ячейки x + y * size
+class Grid:
+    def __init__(self, size):
+        self.size = size
+        self.cells = size * size
+
+        rows = [[x + y * size for x in range(size)] for y in range(size)]
+        columns = [[x + y * size for y in range(size)] for x in range(size)]
+
+        # Линии от края, к которому сдвигаются плитки
+        self.lines = {
+            LEFT: rows,
+            RIGHT: [row[::-1] for row in rows],
+            UP: columns,
+            DOWN: [column[::-1] for column in columns],
+        }
+        self.rows = rows
+        self.columns = columns
+
+        # Выборка значений линии одним вызовом
+        self.getters = {
+            direction: [(line, itemgetter(*line)) for line in lines]
+            for direction, lines in self.lines.items()
+        }
+        self.order = [index for column in columns for index in column]
+
+    def from_cells(self, cells):
+        return tuple(cells)
+
+    def to_cells(self, board):
+        return list(board)
+
+    def move(self, board, direction):
+        cells = list(board)
+        score = 0
+
+        for line in self.lines[direction]:
+            values = tuple([board[i] for i in line])
+            moved, gained = slide_tuple(values)
+            if moved != values:
+                score += gained
+                for index, exponent in zip(line, moved):
+                    cells[index] = exponent
+
+        return tuple(cells), score
+
+    # Ход по списку значений плиток (0 - пустая ячейка):
+    # ({ячейка: новое значение}, очки). Затрагиваются только сдвинутые линии
+    def move_values(self, values, direction):
+        changes = {}
+        score = 0
+
+        for line, getter in self.getters[direction]:
+            current = getter(values)
+            moved, gained = slide_values(current)
+            if moved != current:
+                score += gained
+                for index, old, new in zip(line, current, moved):
+                    if old != new:
+                        changes[index] = new
+
+        return changes, score
+
+    # Пустые ячейки в том же порядке, что и в GameView.update_tiles
+    def empty(self, board):
+        return [index for index in self.order if board[index] == 0]
+
+    def place(self, board, index, exponent):
+        return board[:index] + (exponent,) + board[index + 1:]
+
+    def add_tile(self, board, rng=random, cells=None):
+        if cells is None:
+            cells = self.empty(board)
+        if cells:
+            exponent = 1 if rng.random() < 0.9 else 2  # 2 => 90%, 4 => 10%
+            index = cells.pop(int(rng.random() * len(cells)))
+            board = self.place(board, index, exponent)
+        return board
+
+    def new_board(self, rng=random):
+        cells = list(range(self.cells))
+        board = self.add_tile((0,) * self.cells, rng, cells)
+        return self.add_tile(board, rng, cells)
+
+    def moves_available(self, board):
+        if 0 in board:
+            return True
+        for line in self.rows + self.columns:
+            for a, b in zip(line, line[1:]):
+                if board[a] == board[b]:
+                    return True
+        return False
+
+    def max_exponent(self, board):
+        return max(board)
+
+
+# Пути плиток при сдвиге линии: {откуда: куда}, по правилам slide_line
+def slide_paths(line, limit=GRID_MAX_EXPONENT):
+    line = list(line)
+    origin = [i if exponent else None for i, exponent in enumerate(line)]
+    paths = {i: i for i in range(len(line)) if line[i]}
+
+    for i in range(1, len(line)):
+        if line[i]:
+            index = i
+
+            while index - 1 >= 0 and line[index - 1] == 0:
+                index -= 1
+            if (
+                index - 1 >= 0
+                and line[index - 1] == line[i]
+                and line[i] < limit
+            ):
+                line[index - 1] += 1
+                line[i] = 0
+                paths[origin[i]] = index - 1
+                origin[i] = None
+            elif index < i:
+                line[index] = line[i]
+                line[i] = 0
+                paths[origin[i]] = index
+                origin[index], origin[i] = origin[i], None
+
+    return paths
+
+
+# Пути всех плиток поля при ходе: [(значение, откуда, куда)].
+# values - значения плиток (0 - пустая ячейка), индекс x + y * size
+def tile_paths(grid, values, direction):
+    result = []
+    for line in grid.lines[direction]:
+        exponents = [values[i].bit_length() - 1 if values[i] else 0 for i in line]
+        for start, end in slide_paths(exponents).items():
+            result.append((values[line[start]], line[start], line[end]))
+    return result
+
+
+# Сдвиг линии-кортежа с кэшированием результата
+@lru_cache(maxsize=1 << 16)
+def slide_tuple(line):
+    moved, score = slide_line(line, GRID_MAX_EXPONENT)
+    return tuple(moved), score
+
+
+# То же для линии значений плиток
+@lru_cache(maxsize=1 << 16)
+def slide_values(line):
+    moved, score = slide_line(
+        [value.bit_length() - 1 if value else 0 for value in line],
+        GRID_MAX_EXPONENT,
+    )
+    return tuple([1 << exponent if exponent else 0 for exponent in moved]), score
+
+
+# Правила для заданного размера поля
+def rules(size):
+    if size == SIZE:
+        return Bitboard()
+    return Grid(size)
+
+
+# Индекс пустых ячеек и пар равных соседей для поля GameView.
+# Обновляется только по изменившимся ячейкам, поэтому проверка
+# окончания игры и выбор ячейки для новой плитки не сканируют поле
+class BoardIndex:
+    def __init__(self, size):
+        self.size = size
+        self.cells = size * size
+
+        # Соседи каждой ячейки по горизонтали и вертикали
+        self.neighbours = []
+        for index in range(self.cells):
+            x, y = index % size, index // size
+            self.neighbours.append(
+                [
+                    nx + ny * size
+                    for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+                    if 0 <= nx < size and 0 <= ny < size
+                ]
+            )
+
+        # Рёбра между соседями, затрагивающие каждую ячейку
+        self.edges = [
+            [
+                (min(index, neighbour), max(index, neighbour))
+                for neighbour in self.neighbours[index]
+            ]
+            for index in range(self.cells)
+        ]
+
+        self.rebuild([0] * self.cells)
+
+    # Полный пересчёт по списку значений (0 - пустая ячейка).
+    # empty - порядок пустых ячеек из прежнего индекса (снимок партии),
+    # иначе они идут по возрастанию номера
+    def rebuild(self, values, empty=None):
+        self.values = list(values)
+        if empty is None:
+            empty = [i for i, value in enumerate(self.values) if not value]
+        self.empty = list(empty)
+        self.position = {index: i for i, index in enumerate(self.empty)}
+        self.largest = max(self.values)
+        self.pairs = sum(
+            1
+            for index, value in enumerate(self.values)
+            for neighbour in self.neighbours[index]
+            if neighbour > index and value and value == self.values[neighbour]
+        )
+
+    # Изменение ячеек: {индекс: новое значение}
+    def update(self, changes):
+        values = self.values
+        edges = set()
+        for index in changes:
+            edges.update(self.edges[index])
+
+        self.pairs -= sum(1 for a, b in edges if values[a] and values[a] == values[b])
+
+        for index, value in changes.items():
+            if value and not values[index]:
+                self._remove_empty(index)
+            elif not value and values[index]:
+                self._add_empty(index)
+            values[index] = value
+            if value > self.largest:
+                self.largest = value
+
+        self.pairs += sum(1 for a, b in edges if values[a] and values[a] == values[b])
+
+    def _add_empty(self, index):
+        self.position[index] = len(self.empty)
+        self.empty.append(index)
+
+    # Удаление перестановкой с последним элементом
+    def _remove_empty(self, index):
+        i = self.position.pop(index)
+        last = self.empty.pop()
+        if last != index:
+            self.empty[i] = last
+            self.position[last] = i
+
+    # Есть ли доступный ход
+    def moves_available(self):
+        return bool(self.empty) or self.pairs > 0
@@ -1,7 +1,13 @@
+import os
 import sys
-import csv
+import json
+import math
+import time
+import queue
 import random
-import sqlite3
+from collections import deque
+
+STARTED = time.perf_counter()  # Для --startup-time
 
 from PyQt5.QtWidgets import (
     QApplication,
@@ -10,17 +16,59 @@ from PyQt5.QtWidgets import (
     QTabWidget,
     QVBoxLayout,
     QLabel,
+    QTableView,
     QTableWidget,
     QTableWidgetItem,
+    QHeaderView,
+    QSlider,
     QSpinBox,
     QPushButton,
     QHBoxLayout,
     QCheckBox,
+    QComboBox,
+    QProgressBar,
+)
+from PyQt5.QtCore import (
+    Qt,
+    QRect,
+    QRectF,
+    QPointF,
+    QTimer,
+    QUrl,
+    QObject,
+    QEvent,
+    QAbstractTableModel,
+    QModelIndex,
+    QThread,
+    pyqtSignal,
+)
+from PyQt5.QtGui import (
+    QPainter,
+    QBrush,
+    QPen,
+    QFont,
+    QFontMetricsF,
+    QColor,
+    QIcon,
+    QPixmap,
+    QRegion,
 )
-from PyQt5.QtCore import Qt, QRectF, QUrl
-from PyQt5.QtGui import QPainter, QBrush, QPen, QFont, QColor, QIcon
-from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer, QMediaPlaylist
-from datetime import datetime
+import engine
+import snapshot
+import storage
+import preferences
+import replay
+import undo
+
+IMPORTED = time.perf_counter()
+
+# solver, ntuple, endgame и metrics импортируются при первом
+# использовании: вместе с multiprocessing это заметная часть запуска
+RECORDER = None  # metrics.Metrics, если включены замеры --metrics
+
+
+# Стрелки направлений в подсказках
+ARROWS = {engine.UP: "↑", engine.DOWN: "↓", engine.LEFT: "←", engine.RIGHT: "→"}
 
 
 class Tile:
@@ -28,31 +76,758 @@ class Tile:
         self.value = value
 
 
+# Модель истории игр: строки читаются из SQLite страницами по мере прокрутки,
+# сортировка выполняется запросом
+class HistoryModel(QAbstractTableModel):
+    headers = ["Результат", "Очки", "Рекорд", "Дата и время"]
+    columns = ["result", "score", "best_score", "timestamp"]
+    positions = {"id": 0, "result": 1, "score": 2, "best_score": 3, "timestamp": 4}
+    page = 500  # Строк за одно чтение
+
+    def __init__(self, storage):
+        super().__init__()
+
+        self.storage = storage
+        self.sort_column = "timestamp"  # Как индикатор в заголовке таблицы
+        self.sort_order = Qt.AscendingOrder
+        self.total = 0
+        self.rows = []
+
+        # Чтение после показа вкладки, чтобы она открывалась сразу
+        QTimer.singleShot(0, self.reload)
+
+    # Чтение первой страницы и общего числа строк
+    def load(self):
+        self.total = self.storage.count()
+        self.rows = []  # (id, result, score, best_score, timestamp)
+        self.rows.extend(self.read_page())
+
+    # Следующая страница после последней загруженной строки
+    def read_page(self):
+        return self.storage.page(
+            self.sort_column,
+            self.sort_order == Qt.DescendingOrder,
+            self.row_key(self.rows[-1]) if self.rows else None,
+            self.page,
+        )
+
+    # Ключ сортировки строки, как в ORDER BY
+    def row_key(self, row):
+        return row[self.positions[self.sort_column]], row[0]
+
+    # Место строки с заданным ключом среди загруженных (двоичный поиск)
+    def insert_position(self, key):
+        ascending = self.sort_order == Qt.AscendingOrder
+        low, high = 0, len(self.rows)
+
+        while low < high:
+            middle = (low + high) // 2
+            loaded = self.row_key(self.rows[middle])
+            if (loaded < key) if ascending else (loaded > key):
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+
+        row_id, result, score, best_score, timestamp = self.rows[index.row()]
+        return (
+            result,
+            str(score),
+            str(best_score if best_score > 0 else "-"),
+            storage.display(timestamp),
+        )[index.column()]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+
+        rows = self.read_page()
+        if rows:
+            self.beginInsertRows(
+                QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1
+            )
+            self.rows.extend(rows)
+            self.endInsertRows()
+        else:
+            self.total = len(self.rows)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = self.columns[column]
+        self.sort_order = order
+        self.reload()
+
+    # Полное перечитывание (после очистки или импорта)
+    def reload(self):
+        self.beginResetModel()
+        self.load()
+        self.endResetModel()
+
+    # Добавление одной новой строки после окончания игры
+    def append(self, row_id):
+        row = self.storage.game(row_id)
+        if row is None:
+            return  # Строку уже удалили (очистка или импорт)
+        loaded_all = len(self.rows) == self.total
+        self.total += 1
+
+        # Строка за пределами загруженных придёт со следующей страницей
+        position = self.insert_position(self.row_key(row))
+        if position == len(self.rows) and not loaded_all:
+            return
+
+        self.beginInsertRows(QModelIndex(), position, position)
+        self.rows.insert(position, row)
+        self.endInsertRows()
+
+
+# Импорт и экспорт истории в фоновом потоке.
+# Соединение sqlite3 привязано к потоку, поэтому у потока своё хранилище
+class HistoryTransfer(QThread):
+    progress = pyqtSignal(int)  # Процент выполнения
+    done = pyqtSignal(int)  # Число перенесённых партий
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, csv_path, mode):
+        super().__init__()
+
+        self.path = path
+        self.csv_path = csv_path
+        self.mode = mode  # "import", "merge" или "export"
+
+    def run(self):
+        try:
+            transfer_storage = storage.Storage(self.path)
+            try:
+                if self.mode == "export":
+                    count = transfer_storage.export_csv(
+                        self.csv_path, self.progress.emit
+                    )
+                else:
+                    count = transfer_storage.import_csv(
+                        self.csv_path, self.mode == "merge", self.progress.emit
+                    )
+            finally:
+                transfer_storage.close()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.done.emit(count)
+
+
+# Поиск подсказки (solver.Expectimax) в фоновом потоке, чтобы окно
+# не замирало на время поиска. Поле передаётся списком степеней
+class HintSearch(QThread):
+    found = pyqtSignal(object, float)  # Направление (None - ходов нет), прирост
+
+    def __init__(self, solver, cells, score, size, time_limit):
+        super().__init__()
+
+        self.solver = solver
+        self.cells = cells  # Степени ячеек x + y * size, как в undo_state
+        self.score = score
+        self.size = size
+        self.time_limit = time_limit
+
+    def run(self):
+        direction, gain, depth = self.solver.search_board(
+            list(self.cells), self.size, self.time_limit
+        )
+        self.found.emit(direction, gain)
+
+
+# Запись законченных партий в фоновом потоке: конец игры только ставит
+# партию в очередь. Соединение sqlite3 своё, как у HistoryTransfer
+class HistorySaver(QThread):
+    saved = pyqtSignal(int, int)  # id записанной партии, поколение истории
+    failed = pyqtSignal(str)
+
+    def __init__(self, path):
+        super().__init__()
+
+        self.path = path
+        self.games = queue.Queue()  # (поколение, аргументы add_game); None - остановка
+        self.start()
+
+    # generation возвращается в saved: по нему GameView отбрасывает
+    # сигналы, пришедшие после очистки или импорта истории
+    def add(self, generation, result, score, best_score, timestamp, grid_size, log):
+        self.games.put(
+            (generation, (result, score, best_score, timestamp, grid_size, log))
+        )
+
+    # Ожидание записи всех партий из очереди
+    def flush(self):
+        self.games.join()
+
+    def close(self):
+        self.games.put(None)
+        self.wait()
+
+    def run(self):
+        saver_storage = storage.Storage(self.path)
+        try:
+            while True:
+                game = self.games.get()
+                try:
+                    if game is None:
+                        return
+                    generation, arguments = game
+                    try:
+                        self.saved.emit(saver_storage.add_game(*arguments), generation)
+                    except Exception as e:
+                        self.failed.emit(str(e))
+                finally:
+                    self.games.task_done()
+        finally:
+            saver_storage.close()
+
+
+# Автоигра: партии бота подряд в фоновом потоке. GameView забирает последнюю
+# позицию по таймеру, поэтому кадров не больше 30 в секунду при любом числе
+# ходов; законченные партии пишутся в историю пачками
+class Autoplay(QThread):
+    saved = pyqtSignal()  # Пачка партий записана в историю
+    flush_interval = 1.0  # Запись законченных партий не реже, с
+
+    def __init__(self, path, size, policy_name):
+        super().__init__()
+
+        import tournament  # Стратегии ботов: policy(rules, board, rng) -> ход
+
+        self.path = path
+        self.rules = engine.rules(size)
+        self.policy_name = policy_name
+        self.policy = tournament.POLICIES[policy_name]
+        self.rng = random.Random()
+        self.running = True
+        self.frame = None  # (поле, счёт) после последнего хода
+        self.games = 0
+        self.moves = 0
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    # Ход сделан: позиция для показа и продолжение, пока поток не остановлен
+    def on_move(self, board, score):
+        self.frame = (board, score)
+        self.moves += 1
+        return self.running
+
+    def run(self):
+        import tournament
+
+        history = tournament.HistoryWriter(self.path)
+        flushed = time.perf_counter()
+        try:
+            while self.running:
+                result, score, moves = tournament.play_game(
+                    self.policy, self.rules, self.rng, self.on_move
+                )
+                if result is None:
+                    break  # Остановлена посреди партии, в историю не попадает
+                history.add(result, score, self.rules.size)
+                self.games += 1
+
+                if time.perf_counter() - flushed >= self.flush_interval:
+                    history.flush()
+                    flushed = time.perf_counter()
+                    self.saved.emit()
+        finally:
+            history.close()
+            self.saved.emit()
+
+
+# Гистограмма очков
+class ScoreHistogram(QWidget):
+    def __init__(self):
+        super().__init__()
+
+        self.buckets = []  # [(нижняя граница, число партий)]
+        self.setMinimumHeight(90)
+
+    def set_buckets(self, buckets):
+        self.buckets = buckets
+        self.update()
+
+    def paintEvent(self, event):
+        if not self.buckets:
+            return
+
+        painter = QPainter(self)
+        painter.setFont(QFont("Arial", 7))
+        painter.setPen(QColor(119, 110, 101))
+
+        label = 14  # Высота подписей над и под столбцами
+        width = self.width() / len(self.buckets)
+        height = self.height() - label * 2
+        bottom = label + height
+        largest = max(count for start, count in self.buckets) or 1
+
+        for index, (start, count) in enumerate(self.buckets):
+            bar = height * count / largest
+            left = index * width
+            painter.fillRect(
+                QRectF(left + 1, bottom - bar, width - 2, bar),
+                QColor(237, 194, 46),
+            )
+            painter.drawText(
+                QRectF(left, bottom - bar - label, width, label),
+                Qt.AlignCenter,
+                str(count),
+            )
+            painter.drawText(
+                QRectF(left, bottom, width, label), Qt.AlignCenter, str(start)
+            )
+
+
+# Статистика по сводным таблицам хранилища
+class StatsView(QWidget):
+    def __init__(self, storage):
+        super().__init__()
+
+        self.storage = storage
+
+        self.summary = QLabel()
+        self.summary.setFont(QFont("Arial", 10))
+
+        self.histogram = ScoreHistogram()
+
+        self.sizes_table = QTableWidget(0, 5)
+        self.sizes_table.setHorizontalHeaderLabels(
+            ["Поле", "Партии", "Победы", "Средний", "Рекорд"]
+        )
+
+        self.days_table = QTableWidget(0, 4)
+        self.days_table.setHorizontalHeaderLabels(
+            ["Дата", "Партии", "Победы", "Рекорд"]
+        )
+
+        for table in (self.sizes_table, self.days_table):
+            table.setFont(QFont("Arial", 9))
+            table.verticalHeader().hide()
+            table.verticalHeader().setDefaultSectionSize(20)
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.days_table.horizontalHeader().setSectionResizeMode(
+            0, QHeaderView.ResizeToContents
+        )
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary)
+        layout.addWidget(self.histogram)
+        layout.addWidget(self.sizes_table)
+        layout.addWidget(self.days_table)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    # Чтение сводок: несколько коротких запросов без обхода game_history
+    def refresh(self):
+        stats = self.storage.stats()
+
+        games = sum(row[1] for row in stats["sizes"])
+        wins = sum(row[2] for row in stats["sizes"])
+        total_score = sum(row[3] for row in stats["sizes"])
+
+        if games:
+            self.summary.setText(
+                f"Партий: {games}   Побед: {wins / games:.1%}\n"
+                f"Средний счёт: {total_score / games:.0f}   "
+                f"Медиана: {storage.median(stats['scores']):.0f}"
+            )
+        else:
+            self.summary.setText("История игр пуста")
+
+        self.histogram.set_buckets(storage.histogram(stats["scores"], 8))
+
+        self.fill(
+            self.sizes_table,
+            [
+                (
+                    f"{size}x{size}" if size else "?",
+                    games,
+                    f"{wins / games:.0%}",
+                    f"{total_score / games:.0f}",
+                    best_score,
+                )
+                for size, games, wins, total_score, best_score in stats["sizes"]
+            ],
+        )
+        self.fill(
+            self.days_table,
+            [
+                (
+                    storage.display(day + " 00:00:00")[:10],
+                    games,
+                    f"{wins / games:.0%}",
+                    best_score,
+                )
+                for day, games, wins, total_score, best_score in stats["days"]
+            ],
+        )
+
+    def fill(self, table, rows):
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+
+
+# Просмотр записанной партии с перемоткой к любому ходу
+class ReplayView(QWidget):
+    def __init__(self, game_view, game_replay, title):
+        super().__init__()
+
+        self.game_view = game_view  # Цвета и шрифты плиток
+        self.replay = game_replay
+        self.cells, self.score = game_replay.position(0)
+
+        self.setWindowTitle(title)
+        self.setMinimumSize(345, 420)
+        self.resize(345, 420)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, len(game_replay))
+        self.slider.valueChanged.connect(self.seek)
+
+        self.play_button = QPushButton("▶")
+        self.play_button.setFixedWidth(40)
+        self.play_button.clicked.connect(self.toggle_play)
+
+        self.play_timer = QTimer(self)
+        self.play_timer.setInterval(100)
+        self.play_timer.timeout.connect(self.play_step)
+
+        self.move_label = QLabel()
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.play_button)
+        controls.addWidget(self.slider)
+
+        layout = QVBoxLayout()
+        layout.addStretch()  # Место для поля
+        layout.addWidget(self.move_label)
+        layout.addLayout(controls)
+        self.setLayout(layout)
+
+        self.seek(0)
+
+    # Позиция после number ходов
+    def seek(self, number):
+        self.cells, self.score = self.replay.position(number)
+        self.move_label.setText(
+            f"Ход {number} из {len(self.replay)}    Счёт: {self.score}"
+        )
+        self.update()
+
+    def toggle_play(self):
+        if self.play_timer.isActive():
+            self.play_timer.stop()
+            self.play_button.setText("▶")
+        else:
+            if self.slider.value() == self.slider.maximum():
+                self.slider.setValue(0)
+            self.play_timer.start()
+            self.play_button.setText("❚❚")
+
+    def play_step(self):
+        if self.slider.value() == self.slider.maximum():
+            self.toggle_play()
+        else:
+            self.slider.setValue(self.slider.value() + 1)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Left:
+            self.slider.setValue(self.slider.value() - 1)
+        elif event.key() == Qt.Key_Right:
+            self.slider.setValue(self.slider.value() + 1)
+        elif event.key() == Qt.Key_Home:
+            self.slider.setValue(0)
+        elif event.key() == Qt.Key_End:
+            self.slider.setValue(self.slider.maximum())
+        elif event.key() == Qt.Key_Space:
+            self.toggle_play()
+
+    def paintEvent(self, event):
+        view = self.game_view
+        size = self.replay.size
+        side = min(self.width() - 20, self.height() - 95)  # Место над ползунком
+        left = (self.width() - side) / 2
+        margin, tile_size = view.tile_geometry(size, side)
+
+        painter = QPainter(self)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(view.background)
+        painter.drawRect(self.rect())
+
+        for index, exponent in enumerate(self.cells):
+            value = 1 << exponent if exponent else 0
+            position = QRectF(
+                left + margin + index % size * (tile_size + margin),
+                margin + index // size * (tile_size + margin),
+                tile_size,
+                tile_size,
+            )
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(view.tile_brush(value))
+            painter.drawRoundedRect(position, 5.0, 5.0)
+
+            if value:
+                painter.setPen(view.color_dark if value < 8 else view.color_white)
+                painter.setFont(view.tile_font(value, size, tile_size))
+                painter.drawText(position, Qt.AlignCenter, str(value))
+
+
+# Стена зрителя: партии ботов на одном виджете. Все поля рисуются за один
+# проход paintEvent готовыми плитками, общими для всех полей; поле
+# перерисовывается не чаще одного раза за кадр и только после своего хода
+class SpectatorWall(QWidget):
+    frame_interval = 33  # Кадр, мс (~30 кадров в секунду)
+    move_intervals = (80, 250)  # Ход бота раз в столько мс (случайно на поле)
+    pause_after_game = 1.0  # Показ конечной позиции перед новой партией, с
+    label_height = 16  # Строка со стратегией и счётом над полем
+
+    def __init__(self, game_view, count, size=engine.SIZE, policies=None):
+        super().__init__()
+
+        import tournament  # Стратегии ботов
+
+        self.game_view = game_view  # Цвета и шрифты плиток
+        self.policies = tournament.POLICIES
+        self.size = size
+        self.rules = engine.rules(size)
+        self.rng = random.Random()
+        policies = policies or ["greedy", "corner", "random"]
+
+        # Поле: [стратегия, поле, счёт, время следующего хода, партия окончена]
+        now = time.perf_counter()
+        self.boards = []
+        for number in range(count):
+            self.boards.append(
+                [
+                    policies[number % len(policies)],
+                    self.rules.new_board(self.rng),
+                    0,
+                    now + self.rng.uniform(*self.move_intervals) / 1000,
+                    False,
+                ]
+            )
+        self.slots = []  # Прямоугольник каждого поля
+        self.tile_pixmaps = {}  # Значение -> плитка текущего размера
+
+        self.setWindowTitle(f"2048 - {count} партий")
+        self.setMinimumSize(320, 240)
+        self.resize(960, 720)
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(self.frame_interval)
+        self.frame_timer.timeout.connect(self.frame)
+        self.frame_timer.start()
+
+    # Раскладка полей по сетке, близкой к квадратной
+    def resizeEvent(self, event):
+        count = len(self.boards)
+        columns = max(1, round(math.sqrt(count * self.width() / self.height())))
+        rows = math.ceil(count / columns)
+        width, height = self.width() / columns, self.height() / rows
+        side = max(8.0, min(width, height - self.label_height) - 8)
+
+        # Пропорции поля GameView (сторона 340), уменьшенные до side
+        margin, tile_size = self.game_view.tile_geometry(self.size, 340)
+        self.scale = side / 340
+        self.tile_margin = margin * self.scale
+        self.tile_size = tile_size * self.scale
+
+        self.slots = [
+            QRectF(
+                number % columns * width + (width - side) / 2,
+                number // columns * height + self.label_height,
+                side,
+                side,
+            )
+            for number in range(count)
+        ]
+        self.tile_pixmaps.clear()
+        self.update()
+
+    # Ходы ботов, которым пора ходить; перерисовка только их полей
+    def frame(self):
+        now = time.perf_counter()
+        changed = QRegion()
+
+        for number, board in enumerate(self.boards):
+            policy_name, position, score, due, finished = board
+            if now < due:
+                continue
+
+            if finished:  # Конечная позиция показана, новая партия
+                board[1:3] = self.rules.new_board(self.rng), 0
+                board[4] = False
+            elif (
+                self.rules.max_exponent(position) >= engine.WIN_EXPONENT
+                or not self.rules.moves_available(position)
+            ):
+                board[3] = now + self.pause_after_game
+                board[4] = True
+                continue
+            else:
+                policy = self.policies[policy_name]
+                moved, gained = self.rules.move(
+                    position, policy(self.rules, position, self.rng)
+                )
+                if moved == position:
+                    continue  # Ход в стену, как в play_game: другой в следующем кадре
+                board[1:3] = self.rules.add_tile(moved, self.rng), score + gained
+
+            board[3] = now + self.rng.uniform(*self.move_intervals) / 1000
+            if self.slots:
+                changed += self.slot_rect(number).toAlignedRect()
+
+        if not changed.isEmpty():
+            self.update(changed)
+
+    # Поле вместе со строкой над ним
+    def slot_rect(self, number):
+        return self.slots[number].adjusted(0, -self.label_height, 0, 0)
+
+    # Плитка текущего размера, общая для всех полей
+    def tile_pixmap(self, value):
+        pixmap = self.tile_pixmaps.get(value)
+        if pixmap is None:
+            view = self.game_view
+            ratio = self.devicePixelRatioF()
+            side = int((self.tile_size + 1) * ratio) + 1
+            pixmap = QPixmap(side, side)
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+
+            position = QRectF(0, 0, self.tile_size, self.tile_size)
+            radius = max(1.0, 5.0 * self.scale)
+            painter = QPainter(pixmap)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(view.tile_brush(value))
+            painter.drawRoundedRect(position, radius, radius)
+
+            if value:
+                font = view.tile_font(value, self.size, self.tile_size / self.scale)
+                font.setPointSizeF(max(1.0, font.pointSizeF() * self.scale))
+                painter.setPen(view.color_dark if value < 8 else view.color_white)
+                painter.setFont(font)
+                painter.drawText(position, Qt.AlignCenter, str(value))
+            painter.end()
+
+            self.tile_pixmaps[value] = pixmap
+        return pixmap
+
+    def paintEvent(self, event):
+        view = self.game_view
+        painter = QPainter(self)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(view.background)
+        painter.drawRect(event.rect())
+        painter.setFont(QFont("Arial", 8))
+
+        step = self.tile_size + self.tile_margin
+        region = event.region()
+        for number, (policy_name, position, score, due, finished) in enumerate(
+            self.boards
+        ):
+            slot = self.slots[number]
+            if not region.intersects(self.slot_rect(number).toAlignedRect()):
+                continue
+
+            painter.setPen(view.color_dark)
+            painter.drawText(
+                self.slot_rect(number).adjusted(0, 0, 0, -slot.height()),
+                Qt.AlignLeft | Qt.AlignVCenter,
+                f"{policy_name}  {score}",
+            )
+
+            cells = self.rules.to_cells(position)
+            left = slot.left() + self.tile_margin
+            top = slot.top() + self.tile_margin
+            for index, exponent in enumerate(cells):
+                painter.drawPixmap(
+                    int(left + index % self.size * step),
+                    int(top + index // self.size * step),
+                    self.tile_pixmap(1 << exponent if exponent else 0),
+                )
+
+    # Пробел - пауза
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Space:
+            if self.frame_timer.isActive():
+                self.frame_timer.stop()
+            else:
+                self.frame_timer.start()
+
+
 # Программа
 class Game(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.setFixedSize(345, 450)  # Размер окна
+        self.setMinimumSize(345, 450)  # Размер окна
+        self.resize(345, 450)
         self.game_view = GameView(
             self, self.history_game, self.data_history
         )  # Экземпляр GameView
-        self.connection = sqlite3.connect("files/game_history.db")  # История игр
+        self.storage = storage.open_storage()  # История игр
+        self.history_model = None  # Таблица истории, создаётся с вкладкой
+        self.stats_widget = None
 
         self.tab = QTabWidget()  # Создание вкладок
         self.tab.setFocusPolicy(Qt.NoFocus)  # Игнорирование горячих клавиш вкладок
 
-        # Вкладки
+        # Вкладки; все, кроме игры, строятся при первом открытии
+        self.tab_builders = {}  # Пустая вкладка -> функция построения
         self.tab.addTab(self.game_view, "Игра")
-        self.tab.addTab(self.project_info(), "О проекте")
-        self.tab.addTab(self.history_game(), "История игр")
-        self.tab.addTab(self.game_view.settings(), "Настройки")
+        self.add_lazy_tab(self.project_info, "О проекте")
+        self.add_lazy_tab(self.history_game, "История игр")
+        self.stats_page = self.add_lazy_tab(self.stats_game, "Статистика")
+        self.add_lazy_tab(self.game_view.settings, "Настройки")
+
+        self.tab.currentChanged.connect(self.tab_changed)
 
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)  # Удаление отступов
         layout.addWidget(self.tab)
         self.setLayout(layout)
 
+        # Таблицы ходов 4x4 строятся уже после появления окна
+        QTimer.singleShot(200, engine.load_tables)
+
+    # Пустая вкладка, содержимое которой создаёт build
+    def add_lazy_tab(self, build, title):
+        page = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        page.setLayout(layout)
+
+        self.tab.addTab(page, title)
+        self.tab_builders[page] = build
+        return page
+
     # Вкладка "О проекте"
     def project_info(self):
         info_widget = QWidget()
@@ -65,7 +840,10 @@ class Game(QWidget):
                 В приложении:<br>
                 • Сохранение лучшего результата<br>
                 • История игр, импорт и экспорт<br>
+                • Статистика игр<br>
+                • Просмотр записанных партий<br>
                 • Изменение размера игрового поля<br>
+                • Бесконечная игра<br>
                 • Фоновая музыка<br>
             </p>
             <p>
@@ -76,7 +854,9 @@ class Game(QWidget):
             <p>
                 <br>Горячие клавиши:<br>
                 • Up, Down, Left и Right - <br> перемещение плиток<br>
-                • Esc - начать заново
+                • Esc - начать заново<br>
+                • Z, Backspace / Y - отмена / повтор хода<br>
+                • H - подсказка
             </p>
         """
         )
@@ -89,76 +869,127 @@ class Game(QWidget):
     def data_history(self):
         history_data = []
 
-        with sqlite3.connect("files/game_history.db") as connection:
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT result, score, best_score, timestamp FROM game_history"
+        for result, score, best_score, timestamp, grid_size in self.storage.history():
+            history_data.append(
+                (result, score, best_score, storage.display(timestamp))
             )
 
-            for result, score, best_score, timestamp in cursor.fetchall():
-                history_data.append((result, score, best_score, timestamp))
-
         return history_data
 
     # Вкладка "История игр"
     def history_game(self):
         history_widget = QWidget()
         layout = QVBoxLayout()
-        history_label = QLabel()
+        history_label = QLabel("История игр пуста")
         history_label.setFont(QFont("Arial", 14))
+        history_label.setAlignment(Qt.AlignCenter)
+
+        if self.history_model is None:
+            self.history_model = HistoryModel(self.storage)
 
-        history_data = self.data_history()  # Получить данные об истории игр
+        history_table = QTableView()  # Создание таблицы
 
-        if not history_data:
+        # Сортировка по дате включается до setModel: иначе
+        # setSortingEnabled вызывает sort() и история читается сразу,
+        # а затем ещё раз из отложенного reload модели
+        history_table.horizontalHeader().setSortIndicator(3, Qt.AscendingOrder)
+        history_table.setSortingEnabled(True)
+        history_table.setModel(self.history_model)
+
+        # Ширина столбцов
+        history_table.setColumnWidth(0, 74)
+        history_table.setColumnWidth(1, 54)
+        history_table.setColumnWidth(2, 54)
+        history_table.setColumnWidth(3, 115)
+
+        # Надпись вместо пустой таблицы
+        def update_empty():
             history_label.setText("История игр пуста")
-            history_label.setAlignment(Qt.AlignCenter)
-        else:
-            history_table = QTableWidget()  # Создание таблицы
-
-            # Кол-во строк и столбцов в таблице
-            history_table.setRowCount(len(history_data))
-            history_table.setColumnCount(4)
-
-            history_table.setHorizontalHeaderLabels(
-                ["Результат", "Очки", "Рекорд", "Дата и время"]
-            )  # Заголовки таблицы
-
-            # Заполнение таблицы данными
-            for row,(result, score, best_score, timestamp) \
-                in enumerate(history_data):
-                history_table.setItem(row, 0, QTableWidgetItem(result))
-                history_table.setItem(row, 1, QTableWidgetItem(str(score)))
-                history_table.setItem(
-                    row, 2, QTableWidgetItem(
-                        str(best_score if best_score > 0 else "-")
-                    )
-                )
-                history_table.setItem(row, 3, QTableWidgetItem(timestamp))
+            empty = self.history_model.rowCount() == 0
+            history_label.setVisible(empty)
+            history_table.setVisible(not empty)
 
-                # Ширина столбцов
-                history_table.setColumnWidth(0, 74)
-                history_table.setColumnWidth(1, 54)
-                history_table.setColumnWidth(2, 54)
-                history_table.setColumnWidth(3, 115)
+        history_table.doubleClicked.connect(self.show_replay)
 
-            layout.addWidget(history_table)  # Добавление таблицы
+        self.history_model.modelReset.connect(update_empty)
+        self.history_model.rowsInserted.connect(update_empty)
 
+        # До чтения истории из базы
+        history_label.setText("Загрузка истории...")
+        history_table.setVisible(False)
+
+        layout.addWidget(history_table)  # Добавление таблицы
         layout.addWidget(history_label)
 
         history_widget.setLayout(layout)
         return history_widget
 
+    # Просмотр записи партии по двойному щелчку в истории
+    def show_replay(self, index):
+        game_id, result, score, best_score, timestamp = self.history_model.rows[
+            index.row()
+        ]
+        data = self.storage.game_log(game_id)
+        if data is None:
+            QMessageBox.information(self, "2048", "Для этой партии нет записи ходов")
+            return
+
+        try:
+            game_replay = replay.Replay(data)
+        except ValueError as e:
+            QMessageBox.critical(self, "2048", f"Запись партии повреждена: {e}")
+            return
+
+        self.replay_view = ReplayView(
+            self.game_view,
+            game_replay,
+            f"{result}, {score} очков, {storage.display(timestamp)}",
+        )
+        self.replay_view.show()
+
+    # Вкладка "Статистика"
+    def stats_game(self):
+        self.stats_widget = StatsView(self.storage)
+        return self.stats_widget
+
+    # Построение вкладки при первом открытии;
+    # статистика перечитывается при каждом открытии
+    def tab_changed(self, index):
+        page = self.tab.widget(index)
+        build = self.tab_builders.pop(page, None)
+        if build is not None:
+            page.layout().addWidget(build())
+        elif page is self.stats_page:
+            self.stats_widget.refresh()
+
     # Перенаправление горячих клавиш
     def keyPressEvent(self, event):
         self.tab.currentWidget().keyPressEvent(event) 
 
     # Закрыть соединение с базой данных
     def close_connection(self):
-        self.connection.close()
+        self.game_view.stop_autoplay()  # Партия игрока вместо позиции бота
+        if self.game_view.transfer is not None:
+            self.game_view.transfer.wait()  # Дождаться импорта/экспорта
+        if self.game_view.hint_search is not None:
+            self.game_view.hint_search.wait()  # Поиск не дольше hint_time
+        self.game_view.preferences.flush()
+        self.game_view.save_snapshot()
+        self.game_view.snapshot_writer.close()  # Дождаться записи снимка
+        self.game_view.history_saver.close()  # Дождаться записи партий
+        self.storage.close()
+        if RECORDER is not None:
+            RECORDER.dump()
 
 
 # 2048
 class GameView(QWidget):
+    font_sizes = {2: 22, 3: 20, 4: 18, 5: 16, 6: 14}  # Размер сетки -> шрифт плиток
+    grid_max = engine.GRID_MAX  # Наибольший размер сетки
+    metrics_lines = 14  # Строк в таблице замеров
+    wall_max = 64  # Наибольшее число полей на стене зрителя
+    autoplay_policies = ("corner", "greedy", "random")  # Стратегии в настройках
+
     def __init__(self, game, history_game, data_history):
         super().__init__()
 
@@ -166,19 +997,26 @@ class GameView(QWidget):
         self.history_game = history_game
         self.data_history = data_history
 
-        self.connection = sqlite3.connect("files/game_history.db")  # История игр
+        self.storage = storage.open_storage()  # История игр
+        self.history_saver = HistorySaver(self.storage.path)
+        self.history_generation = 0  # Растёт при очистке и импорте истории
+        self.history_saver.saved.connect(self.history_saved)
+        self.history_saver.failed.connect(self.history_failed)
 
-        # Размер сетки
-        try:
-            with open("files/grid.txt", "r") as file:
-                self.grid_size = int(file.read())
-        except FileNotFoundError:
-            self.grid_size = 4
+        # Настройки пишутся на диск не чаще раза в секунду
+        self.preferences = preferences.Preferences()
+        self.preferences_timer = QTimer(self)
+        self.preferences_timer.setSingleShot(True)
+        self.preferences_timer.setInterval(1000)
+        self.preferences_timer.timeout.connect(self.preferences.flush)
 
-        self.tile_margin = 10  # Расстояние между плитками
-        self.tile_size = (
-            340 - self.tile_margin * (self.grid_size + 1)
-        ) / self.grid_size  # Размер плитки
+        self.grid_size = self.preferences.get("grid_size")  # Размер сетки
+        self.endless = self.preferences.get("endless")  # Игра после 2048
+
+        # Расстояние между плитками, размер плитки и отступ поля слева
+        # пересчитываются по размеру виджета в layout_tiles
+        self.tile_margin, self.tile_size = self.tile_geometry(self.grid_size, 340)
+        self.board_left = 0
 
         # Цвета плиток
         self.colors_tile = {
@@ -204,281 +1042,557 @@ class GameView(QWidget):
         self.color_white = QPen(QColor(0xF9F6F2))
         self.color_dark = QPen(QColor(0x776E65))
 
-        # Музыка
-        self.media_playlist = QMediaPlaylist()
-        self.media_playlist.addMedia(
-            QMediaContent(QUrl.fromLocalFile("music/1.mp3"))
+        self.font_block = QFont("Arial", 14)  # Шрифт блоков "Счёт" и "Рекорд"
+
+        # Анимация ходов: очередь переходов (значения до хода, пути плиток)
+        self.animation_time = 0.1  # Длительность одного хода, с
+        self.animation_queue = 4  # Предел очереди, лишние переходы пропускаются
+        self.animations = deque()
+        self.animation_started = 0.0
+        self.animation_timer = QTimer(self)
+        self.animation_timer.setInterval(16)  # ~60 кадров в секунду
+        self.animation_timer.timeout.connect(self.animation_step)
+        self.tile_pixmaps = {}  # Отрисованные плитки: (значение, размер, шрифт, сдвиг)
+
+        # Музыка; проигрыватель создаётся при первом включении
+        self.media_playlist = None
+        self.media_player = None
+
+        # Подсказка
+        self.solver = None  # Создаётся при первом запросе
+        self.hint_search = None  # Фоновый поток HintSearch
+        self.endgames = {}  # Размер поля -> (время изменения файла, таблица или None)
+        self.hint_time = self.preferences.get("hint_time")  # Время на поиск хода, мс
+        self.hint_text = ""
+
+        hint_button = QPushButton("Подсказка", self)
+        hint_button.setGeometry(190, 10, 140, 28)
+        hint_button.setFocusPolicy(Qt.NoFocus)
+        hint_button.clicked.connect(self.show_hint)
+
+        # Совет обученной n-tuple сети после каждого хода (только 4x4)
+        self.network = None
+        if self.preferences.get("network_hint"):
+            self.load_network()
+
+        # Отмена и повтор ходов
+        self.undo_history = undo.UndoHistory(self.preferences.get("undo_limit") * 1024)
+
+        # Замеры (main.py --metrics), F3 - показать поверх поля
+        self.metrics_overlay = False
+        self.metrics_timer = None
+
+        # Импорт/экспорт истории
+        self.transfer = None  # Фоновый поток HistoryTransfer
+        self.transfer_buttons = []
+        self.transfer_progress = None
+        self.merge_checkbox = None
+
+        # Итог партии поверх поля; окно не ждёт нажатия
+        self.notice = QLabel(self)
+        self.notice.setAlignment(Qt.AlignCenter)
+        self.notice.setStyleSheet(
+            "background: rgba(119, 110, 101, 220); color: #F9F6F2;"
+            " font: bold 14pt Arial; border-radius: 6px; padding: 8px;"
         )
-        self.media_playlist.setPlaybackMode(QMediaPlaylist.CurrentItemInLoop)
-
-        self.media_player = QMediaPlayer(self)
-        self.media_player.setPlaylist(self.media_playlist)
-        self.media_player.setVolume(50)  # Громкость
+        self.notice.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.notice.hide()
+        self.notice_timer = QTimer(self)
+        self.notice_timer.setSingleShot(True)
+        self.notice_timer.setInterval(2500)
+        self.notice_timer.timeout.connect(self.notice.hide)
+
+        # Автоигра: позиция бота показывается вместо партии игрока
+        self.autoplay = None  # Фоновый поток Autoplay
+        self.autoplay_saved = None  # Партия игрока на время автоигры
+        self.autoplay_button = None
+        self.autoplay_frame_shown = None
+        self.autoplay_rate = (0.0, 0)  # Время и число ходов для скорости
+        self.autoplay_timer = QTimer(self)
+        self.autoplay_timer.setInterval(34)  # Не больше 30 кадров в секунду
+        self.autoplay_timer.timeout.connect(self.autoplay_frame)
+
+        # Снимок партии: продолжение после перезапуска
+        self.rng = random.Random()  # Состояние входит в снимок
+        self.snapshot_writer = snapshot.Writer()
+        self.snapshot_dirty = False  # Партия изменилась после снимка
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.setInterval(5000)
+        self.snapshot_timer.timeout.connect(self.save_snapshot)
+        self.snapshot_timer.start()
 
         self.record()
-        self.game_history()
-        self.reset_game()
+        if not self.resume_game():
+            self.reset_game()
 
-    # Чтение рекорда
+    # Чтение рекорда для текущего размера сетки
     def record(self):
-        try:
-            with open("files/record.txt", "r") as file:
-                self.high_score = int(file.read())
-        except FileNotFoundError:
-            self.high_score = 0
-
-    # Создание таблицы для хранения истории игр
-    def game_history(self):
-        with self.connection:
-            self.connection.execute(
-                """
-                CREATE TABLE IF NOT EXISTS game_history (
-                    id INTEGER PRIMARY KEY,
-                    result TEXT,
-                    score INTEGER,
-                    best_score INTEGER,
-                    timestamp DATETIME
-                )
-                """
-            )
+        self.high_score = self.preferences.high_score(self.grid_size)
+
+    # Отложенная запись настроек
+    def save_preferences(self):
+        if not self.preferences_timer.isActive():
+            self.preferences_timer.start()
 
     # Обновление вкладки об истории игр
     def update_history_tab(self):
-        self.game.tab.removeTab(2)
-        self.game.tab.insertTab(2, self.history_game(), "История игр")
+        if self.game.history_model is not None:
+            self.game.history_model.reload()
 
-    # Обновление истории после каждой игры
-    def update_history(self, result, score):
+    # Обновление истории после каждой игры; запись - в HistorySaver
+    def update_history(self, score, result):
         best_score = self.high_score if self.score >= self.high_score else -1
-        timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-
-        with self.connection:
-            self.connection.execute(
-                f"""
-                INSERT INTO game_history (score, result, best_score, timestamp)
-                VALUES (?, ?, ?, ?)
-            """,
-                (result, score, best_score, timestamp),
-            )
+        self.history_saver.add(
+            self.history_generation,
+            result,
+            score,
+            best_score,
+            storage.now(),
+            self.grid_size,
+            self.game_log.encode(),
+        )
 
-        self.update_history_tab()
+    # Партия записана
+    def history_saved(self, row_id, generation):
+        if generation != self.history_generation:
+            return  # Записана до очистки или импорта: модель уже перечитана
+        if self.game.history_model is not None:
+            self.game.history_model.append(row_id)  # Только новая строка
+
+    def history_failed(self, error):
+        self.show_notice(f"Партия не сохранена: {error}")
+
+    # Конец партии: запись в историю, сообщение и сразу новая партия
+    def finish_game(self, result, text):
+        self.high_score = max(self.score, self.high_score)
+        self.update_history(self.score, result)
+        self.show_notice(f"{text}\nСчёт: {self.score}")
+        self.reset_game()
+
+    # Сообщение поверх поля, скрывается само
+    def show_notice(self, text):
+        self.notice.setText(text)
+        self.notice.adjustSize()
+        board = self.board_rect()
+        self.notice.move(
+            board.center().x() - self.notice.width() // 2,
+            board.top() + 20,
+        )
+        self.notice.show()
+        self.notice.raise_()
+        self.notice_timer.start()
 
     # Начать заново
     def reset_game(self):
         self.tiles = [
             [None for _ in range(self.grid_size)] for _ in range(self.grid_size)
         ]
-        self.tiles_empty = list(
-            range(0, self.grid_size * self.grid_size)
-        )  # Пустые ячейки
+        self.board_index = engine.BoardIndex(
+            self.grid_size
+        )  # Пустые ячейки и пары равных соседей
+        self.grid = engine.Grid(self.grid_size)  # Линии поля для анимации
         self.score = 0  # Счёт
+        self.hint_text = ""
+        self.game_log = replay.GameLog(self.grid_size)  # Запись ходов партии
+        self.undo_history.clear()
         self.add_tile()
         self.add_tile()
+        if self.network is not None:
+            self.suggest_move()
+        self.tile_spawned = None  # Плитка, созданная последним ходом
+        self.animations.clear()
+        self.snapshot_dirty = True
         self.update()  # Перерисовка плиток
 
+    # Продолжение партии из снимка; False, если снимка нет
+    # или он для другого размера поля
+    def resume_game(self):
+        saved = snapshot.read()
+        if saved is None or saved[0] != self.grid_size:
+            return False
+        size, cells, score, empty, log, rng_state = saved
+        try:
+            game_log = replay.restore(log)
+        except ValueError:
+            return False
+
+        self.reset_game()
+        self.game_log = game_log
+        self.restore_state((cells, score, game_log.mark()))
+        if empty is not None:  # Порядок, в котором add_tile выбирает ячейку
+            self.board_index.rebuild(self.board_index.values, empty)
+        self.rng.setstate(rng_state)  # После reset_game, который тратит rng
+        self.snapshot_dirty = False
+        return True
+
+    # Снимок партии, если она изменилась; запись - в фоновом потоке
+    def save_snapshot(self):
+        if not self.snapshot_dirty or self.autoplay is not None:
+            return
+        board, score, mark = self.undo_state()
+        self.snapshot_writer.submit(
+            snapshot.encode(
+                self.grid_size,
+                board,
+                score,
+                self.board_index.empty,
+                self.game_log.encode(),
+                self.rng.getstate(),
+            )
+        )
+        self.snapshot_dirty = False
+
     # Создание плитки
     def add_tile(self):
-        if len(self.tiles_empty) > 0:
+        tiles_empty = self.board_index.empty
+
+        if len(tiles_empty) > 0:
             tile_new = (
-                2 if random.random() < 0.9 else 4
+                2 if self.rng.random() < 0.9 else 4
             )  # Создание плитки 2 с вероятностью 90%, 4 => 10%
-            index = self.tiles_empty.pop(
-                int(random.random() * len(self.tiles_empty))
-            )  # Размещение плитки в любой пустой ячейке
+            index = tiles_empty[
+                int(self.rng.random() * len(tiles_empty))
+            ]  # Размещение плитки в любой пустой ячейке
             grid_X = index % self.grid_size
             grid_Y = index // self.grid_size
             self.tiles[grid_X][grid_Y] = Tile(tile_new)
+            self.board_index.update({index: tile_new})
+            self.game_log.spawn(index, tile_new.bit_length() - 1)
+            self.tile_spawned = index
+            self.update_cells([(grid_X, grid_Y)])
+
+    # Пересчёт индекса после замены self.tiles целиком
+    def rebuild_index(self):
+        self.board_index.rebuild(
+            [
+                0 if tile is None else tile.value
+                for tile in (
+                    self.tiles[index % self.grid_size][index // self.grid_size]
+                    for index in range(self.grid_size * self.grid_size)
+                )
+            ]
+        )
+
+    # Ход с анимацией. Логическое поле меняется сразу,
+    # а отрисовка догоняет его через очередь переходов
+    def make_move(self, direction):
+        values = list(self.board_index.values)
+        state = self.undo_state()
+        self.tile_spawned = None
+
+        {
+            engine.UP: self.up,
+            engine.DOWN: self.down,
+            engine.LEFT: self.left,
+            engine.RIGHT: self.right,
+        }[direction]()
+
+        # Ход не изменил поле или игра началась заново
+        if self.tile_spawned is None:
+            return
+
+        self.undo_history.push(state)
+        self.animations.append(
+            (values, engine.tile_paths(self.grid, values, direction))
+        )
+        if len(self.animations) > self.animation_queue:
+            self.animations.popleft()  # Пропуск самого старого перехода
+            self.animation_started = time.perf_counter()
+        if not self.animation_timer.isActive():
+            self.animation_started = time.perf_counter()
+            self.animation_timer.start()
+
+    # Состояние для отмены: степени ячеек байтами, счёт и положение записи партии
+    def undo_state(self):
+        return (
+            bytes(
+                [
+                    value.bit_length() - 1 if value else 0
+                    for value in self.board_index.values
+                ]
+            ),
+            self.score,
+            self.game_log.mark(),
+        )
+
+    # Возврат к сохранённому состоянию
+    def restore_state(self, state):
+        board, self.score, mark = state
+        self.game_log.rewind(mark)
+        self.show_cells(board)
+
+        self.hint_text = ""
+        if self.network is not None:
+            self.suggest_move()
+        self.tile_spawned = None
+        self.animations.clear()
+        self.snapshot_dirty = True
+        self.update()
+
+    # Плитки по степеням ячеек x + y * size
+    def show_cells(self, board):
+        values = [1 << exponent if exponent else 0 for exponent in board]
+        self.tiles = [
+            [
+                Tile(values[grid_X + grid_Y * self.grid_size])
+                if values[grid_X + grid_Y * self.grid_size]
+                else None
+                for grid_Y in range(self.grid_size)
+            ]
+            for grid_X in range(self.grid_size)
+        ]
+        self.rebuild_index()
+
+    # Отмена хода
+    def undo_move(self):
+        state = self.undo_history.undo(self.undo_state())
+        if state is not None:
+            self.restore_state(state)
+
+    # Повтор отменённого хода
+    def redo_move(self):
+        state = self.undo_history.redo(self.undo_state())
+        if state is not None:
+            self.restore_state(state)
+
+    # Прогресс текущего перехода от 0 до 1.
+    # При накопленной очереди переходы проигрываются быстрее
+    def animation_progress(self):
+        duration = self.animation_time / len(self.animations)
+        return min(1.0, (time.perf_counter() - self.animation_started) / duration)
+
+    # Кадр анимации по таймеру
+    def animation_step(self):
+        if self.animations and self.animation_progress() >= 1.0:
+            self.animations.popleft()
+            self.animation_started = time.perf_counter()
+        if not self.animations:
+            self.animation_timer.stop()
+
+        self.update(self.board_rect())
 
     # Клавиша "Вперёд"
     def up(self):
-        tile_moved = False
-
-        for grid_X in range(self.grid_size):
-            for grid_Y in range(1, self.grid_size):
-                if self.tiles[grid_X][grid_Y] is not None:
-                    index = grid_Y
-
-                    while index - 1 >= 0 and self.tiles[grid_X][index - 1] is None:
-                        index -= 1
-                    if (
-                        index - 1 >= 0
-                        and self.tiles[grid_X][index - 1].value
-                        == self.tiles[grid_X][grid_Y].value
-                    ):
-                        self.score += self.tiles[grid_X][grid_Y].value * 2
-                        self.tiles[grid_X][index - 1].value *= 2
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-                    elif index < grid_Y:
-                        self.tiles[grid_X][index] = self.tiles[grid_X][grid_Y]
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-
-        if tile_moved:
-            self.update_tiles()
+        self.move_board(engine.UP)
 
     # Клавиша "Назад"
     def down(self):
-        tile_moved = False
-
-        for grid_X in range(self.grid_size):
-            for grid_Y in range(self.grid_size - 2, -1, -1):
-                if self.tiles[grid_X][grid_Y] is not None:
-                    index = grid_Y
-
-                    while (
-                        index + 1 < self.grid_size
-                        and self.tiles[grid_X][index + 1] is None
-                    ):
-                        index += 1
-                    if (
-                        index + 1 < self.grid_size
-                        and self.tiles[grid_X][index + 1].value
-                        == self.tiles[grid_X][grid_Y].value
-                    ):
-                        self.score += self.tiles[grid_X][grid_Y].value * 2
-                        self.tiles[grid_X][index + 1].value *= 2
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-                    elif index > grid_Y:
-                        self.tiles[grid_X][index] = self.tiles[grid_X][grid_Y]
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-
-        if tile_moved:
-            self.update_tiles()
+        self.move_board(engine.DOWN)
 
     # Клавиша "Влево"
     def left(self):
-        tile_moved = False
-
-        for grid_X in range(1, self.grid_size):
-            for grid_Y in range(self.grid_size):
-                if self.tiles[grid_X][grid_Y] is not None:
-                    index = grid_X
-
-                    while index - 1 >= 0 and self.tiles[index - 1][grid_Y] is None:
-                        index -= 1
-                    if (
-                        index - 1 >= 0
-                        and self.tiles[index - 1][grid_Y].value
-                        == self.tiles[grid_X][grid_Y].value
-                    ):
-                        self.score += self.tiles[grid_X][grid_Y].value * 2
-                        self.tiles[index - 1][grid_Y].value *= 2
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-                    elif index < grid_X:
-                        self.tiles[index][grid_Y] = self.tiles[grid_X][grid_Y]
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-
-        if tile_moved:
-            self.update_tiles()
+        self.move_board(engine.LEFT)
 
     # Клавиша "Вправо"
     def right(self):
-        tile_moved = False
-
-        for grid_X in range(self.grid_size - 2, -1, -1):
-            for grid_Y in range(self.grid_size):
-                if self.tiles[grid_X][grid_Y] is not None:
-                    index = grid_X
-
-                    while (
-                        index + 1 < self.grid_size
-                        and self.tiles[index + 1][grid_Y] is None
-                    ):
-                        index += 1
-                    if (
-                        index + 1 < self.grid_size
-                        and self.tiles[index + 1][grid_Y].value
-                        == self.tiles[grid_X][grid_Y].value
-                    ):
-                        self.score += self.tiles[grid_X][grid_Y].value * 2
-                        self.tiles[index + 1][grid_Y].value *= 2
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-                    elif index > grid_X:
-                        self.tiles[index][grid_Y] = self.tiles[grid_X][grid_Y]
-                        self.tiles[grid_X][grid_Y] = None
-                        tile_moved = True
-
-        if tile_moved:
-            self.update_tiles()
-
-    # Обновление плиток
-    def update_tiles(self):
-        self.tiles_empty = []
-
-        for x in range(self.grid_size):
-            for y in range(self.grid_size):
-                tile = self.tiles[x][y]
-
-                if tile is not None and tile.value == 2048:
-                    if self.score > self.high_score:
-                        self.high_score = self.score
-
-                    QMessageBox.information(self, "2048", "Вы выиграли!")
-                    self.update_history(self.score, "Выигрыш")
-                    self.reset_game()
-
-                if self.tiles[x][y] is None:
-                    self.tiles_empty.append(x + y * self.grid_size)
+        self.move_board(engine.RIGHT)
+
+    # Ход движком: битборд для 4x4, пока степени помещаются в 4 бита,
+    # иначе по линиям значений. Стоимость хода растёт с числом ячеек линейно
+    def move_board(self, direction):
+        values = self.board_index.values
+
+        if (
+            self.grid_size == engine.SIZE
+            and self.board_index.largest < 1 << engine.MAX_EXPONENT
+        ):
+            board = engine.from_values(values)
+            board_moved, score = engine.move(board, direction)
+            changes = {
+                index: value
+                for index, value in enumerate(engine.to_values(board_moved))
+                if value != values[index]
+            }
+        else:
+            changes, score = self.grid.move_values(values, direction)
 
-        self.add_tile()
+        if not changes:
+            return
+
+        self.game_log.move(direction)
+        self.score += score
+        tiles_changed = set()
+
+        # Обновляются только изменившиеся ячейки
+        for index, value in changes.items():
+            grid_X = index % self.grid_size
+            grid_Y = index // self.grid_size
+            self.tiles[grid_X][grid_Y] = Tile(value) if value else None
+            tiles_changed.add((grid_X, grid_Y))
+
+        self.update_tiles(tiles_changed)
+
+    # Подсказка лучшего хода: из точной таблицы сразу, иначе поиск
+    # в фоновом потоке, результат приходит в hint_found
+    def show_hint(self):
+        if self.exact_hint():
+            self.update_header()
+            return
+
+        if self.hint_search is not None:
+            return  # Поиск уже идёт
+
+        if self.solver is None:
+            import solver
+
+            self.solver = solver.Expectimax()
+
+        cells, score, mark = self.undo_state()
+        self.hint_search = HintSearch(
+            self.solver, cells, score, self.grid_size, self.hint_time / 1000
+        )
+        self.hint_search.found.connect(self.hint_found)
+        self.hint_search.finished.connect(self.hint_finished)
+        self.hint_text = "Поиск хода..."
+        self.update_header()
+        self.hint_search.start()
+
+    def hint_found(self, direction, gain):
+        search = self.hint_search
+        if self.undo_state()[:2] != (search.cells, search.score):
+            return  # Пока шёл поиск, на поле сделали ход
+
+        if direction is None:
+            self.hint_text = "Ходов нет"
+        else:
+            self.hint_text = f"{ARROWS[direction]}  ≈{int(search.score + gain)}"
+
+        self.update_header()
+
+    def hint_finished(self):
+        self.hint_search.deleteLater()
+        self.hint_search = None
+
+    # Ход из точной таблицы (endgame.py) для полей 2x2 и 3x3, если она
+    # построена: стрелка и вероятность собрать плитку-цель
+    def exact_hint(self):
+        import endgame
+
+        if self.grid_size not in endgame.GOALS:
+            return False
+
+        # Файл проверяется при каждой подсказке: таблицу могут построить
+        # (python endgame.py build) или перестроить, не закрывая игру
+        try:
+            mtime = os.stat(endgame.PATH.format(size=self.grid_size)).st_mtime_ns
+        except OSError:
+            mtime = None
+        cached_mtime, database = self.endgames.get(self.grid_size, (None, None))
+        if mtime != cached_mtime:
+            if database is not None:
+                database.close()
+            database = None
+            if mtime is not None:
+                try:
+                    database = endgame.load(self.grid_size)
+                except (OSError, ValueError):
+                    pass  # Повреждённый файл не читается снова, пока не изменится
+            self.endgames[self.grid_size] = (mtime, database)
+        if database is None:
+            return False
+
+        result = database.lookup_cells(self.undo_state()[0])
+        if result is None or result[0] is None:
+            return False  # Цель собрана или позиции нет: обычный поиск
+        direction, probability = result
+        self.hint_text = (
+            f"{ARROWS[direction]}  {probability:.0%} до {1 << database.rules.goal}"
+        )
+        return True
+
+    # Обновление плиток.
+    # tiles_changed - ячейки (x, y), изменённые ходом; без них индекс
+    # пересчитывается по всему полю
+    def update_tiles(self, tiles_changed=None):
+        self.hint_text = ""
+        self.snapshot_dirty = True
+
+        if tiles_changed is None:
+            self.rebuild_index()
+        else:
+            self.board_index.update(
+                {
+                    x + y * self.grid_size: (
+                        0 if self.tiles[x][y] is None else self.tiles[x][y].value
+                    )
+                    for x, y in tiles_changed
+                }
+            )
+
+        if self.board_index.largest >= 2048 and not self.endless:
+            self.finish_game(storage.WIN, "Вы выиграли!")
+        else:
+            self.add_tile()
+
+        if self.network is not None:
+            self.suggest_move()
         self.high_score = max(self.score, self.high_score)
-        self.update()
+        self.update_header()
+        if tiles_changed is None:
+            self.update()
+        else:
+            self.update_cells(tiles_changed)
 
         # Сохранение рекорда
-        try:
-            with open("files/record.txt", "w") as file:
-                file.write(str(self.high_score))
-        except FileNotFoundError:
-            self.high_score = 0
+        if self.preferences.set_high_score(self.grid_size, self.high_score):
+            self.save_preferences()
 
         if not self.tiles_available():
-            QMessageBox.information(self, "2048", "Игра окончена")
-            self.update_history(self.score, "Проигрыш")
-            self.reset_game()
+            # В бесконечной игре партия с плиткой 2048 считается выигранной
+            self.finish_game(
+                storage.WIN if self.board_index.largest >= 2048 else storage.LOSS,
+                "Игра окончена",
+            )
+
+    # Ход, который выбрала бы сеть; на других полях и после плитки 32768
+    # (степень не помещается в битборд) совета нет
+    def suggest_move(self):
+        if (
+            self.grid_size != engine.SIZE
+            or self.board_index.largest >= 1 << engine.MAX_EXPONENT
+        ):
+            return
+        board = engine.from_values(self.board_index.values)
+        direction = self.network.best_move(board)[0]
+        if direction is not None:
+            self.hint_text = f"Сеть: {ARROWS[direction]}"
 
     # Проверка доступных ходов
     def tiles_available(self):
-        for x in range(self.grid_size):
-            for y in range(self.grid_size):
-                if (
-                    self.tiles_empty
-                    or (
-                        x < self.grid_size - 1
-                        and self.tiles[x][y].value == self.tiles[x + 1][y].value
-                    )
-                    or (
-                        y < self.grid_size - 1
-                        and self.tiles[x][y].value == self.tiles[x][y + 1].value
-                    )
-                ):
-                    return True
-
-        return False
+        return self.board_index.moves_available()
 
     # События клавиш
     def keyPressEvent(self, event):
+        # Во время автоигры клавиши не ходят, Esc останавливает бота
+        if self.autoplay is not None and event.key() != Qt.Key_F3:
+            if event.key() == Qt.Key_Escape:
+                self.stop_autoplay()
+            return
+
         if event.key() == Qt.Key_Escape:
             self.reset_game()
+        elif event.key() in (Qt.Key_Z, Qt.Key_Backspace):
+            self.undo_move()
+        elif event.key() == Qt.Key_Y:
+            self.redo_move()
         elif event.key() == Qt.Key_Up:
-            self.up()
+            self.make_move(engine.UP)
         elif event.key() == Qt.Key_Down:
-            self.down()
+            self.make_move(engine.DOWN)
         elif event.key() == Qt.Key_Left:
-            self.left()
+            self.make_move(engine.LEFT)
         elif event.key() == Qt.Key_Right:
-            self.right()
+            self.make_move(engine.RIGHT)
+        elif event.key() == Qt.Key_H:
+            self.show_hint()
+        elif event.key() == Qt.Key_F3 and RECORDER is not None:
+            self.toggle_metrics()
 
     # Блок "Счёт"
     def block_score(self, painter):
         painter.setBrush(self.colors_element)
         painter.drawRoundedRect(QRectF(10, 10, 80, 60), 10.0, 10.0)
-        painter.setFont(QFont("Arial", 14))
+        painter.setFont(self.font_block)
         painter.setPen(self.color_text)
         painter.drawText(QRectF(20, 15, 80, 20), "Счёт")
 
@@ -486,66 +1600,226 @@ class GameView(QWidget):
     def block_best(self, painter):
         painter.setBrush(self.colors_element)
         painter.drawRoundedRect(QRectF(100, 10, 80, 60), 10.0, 10.0)
-        painter.setFont(QFont("Arial", 14))
+        painter.setFont(self.font_block)
         painter.setPen(self.color_text)
         painter.drawText(QRectF(110, 15, 80, 20), "Рекорд")
 
+    # Расстояние между плитками для сетки size
+    def margin_for(self, size):
+        return 10 if size <= 6 else max(2, 60 // size)
+
+    # Расстояние между плитками и размер плитки для сетки size на стороне side
+    def tile_geometry(self, size, side):
+        margin = self.margin_for(size)
+        return margin, (side - margin * (size + 1)) / size
+
+    # Размеры плиток по размеру виджета: у исходного окна поле 340 пикселей,
+    # под нижним рядом плиток остаётся 5 пикселей
+    def layout_tiles(self):
+        margin = self.margin_for(self.grid_size)
+        side = max(340, min(self.width() - 1, self.height() - 85 + margin))
+        self.tile_margin, self.tile_size = self.tile_geometry(self.grid_size, side)
+        self.board_left = (self.width() - 1 - side) // 2
+        self.tile_pixmaps.clear()
+        self.update()
+
+    def resizeEvent(self, event):
+        self.layout_tiles()
+
+    # Цвет плитки; после 2048 цвета строятся по степени
+    def tile_brush(self, value):
+        brush = self.colors_tile.get(value)
+        if brush is None:
+            exponent = value.bit_length() - 1
+            brush = QBrush(QColor.fromHsv((exponent - 12) * 47 % 360, 170, 110))
+            self.colors_tile[value] = brush
+        return brush
+
+    # Шрифт плитки: по размеру сетки, меньше, если число не помещается
+    def tile_font(self, value, size, tile_size):
+        font = QFont("Arial", self.font_sizes.get(size, max(5, int(tile_size * 0.3))))
+        width = QFontMetricsF(font).width(str(value))
+        if width > tile_size:
+            font.setPointSizeF(max(4.0, font.pointSizeF() * tile_size * 0.9 / width))
+        return font
+
+    # Положение плитки
+    def tile_rect(self, grid_X, grid_Y):
+        return QRectF(
+            self.board_left
+            + self.tile_margin
+            + grid_X * (self.tile_size + self.tile_margin),
+            80 + self.tile_margin + grid_Y * (self.tile_size + self.tile_margin),
+            self.tile_size,
+            self.tile_size,
+        )
+
+    # Плитка, отрисованная заранее (0 - пустая ячейка).
+    # Дробная часть положения входит в ключ, чтобы плитка совпадала
+    # с нарисованной напрямую
+    def tile_pixmap(self, value, offset_X=0.0, offset_Y=0.0):
+        key = (value, self.tile_size, self.grid_size, offset_X, offset_Y)
+        pixmap = self.tile_pixmaps.get(key)
+
+        if pixmap is None:
+            ratio = self.devicePixelRatioF()
+            side = int((self.tile_size + 1) * ratio) + 1
+            pixmap = QPixmap(side, side)
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+
+            position = QRectF(offset_X, offset_Y, self.tile_size, self.tile_size)
+            painter = QPainter(pixmap)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(self.tile_brush(value))
+            painter.drawRoundedRect(position, 5.0, 5.0)  # Скругление плиток
+
+            if value:
+                painter.setPen(self.color_dark if value < 8 else self.color_white)
+                painter.setFont(self.tile_font(value, self.grid_size, self.tile_size))
+                painter.drawText(
+                    position, Qt.AlignCenter | Qt.AlignVCenter, str(value)
+                )
+            painter.end()
+
+            self.tile_pixmaps[key] = pixmap
+
+        return pixmap
+
+    # Перерисовка только указанных ячеек
+    def update_cells(self, cells):
+        for grid_X, grid_Y in cells:
+            self.update(self.tile_rect(grid_X, grid_Y).toAlignedRect())
+
+    # Перерисовка блоков счёта и подсказки
+    def update_header(self):
+        self.update(QRect(0, 0, self.width(), 80))
+
+    # Область игрового поля
+    def board_rect(self):
+        return QRect(0, 80, self.width(), self.height() - 80)
+
+    # Кадр анимации: пустые ячейки и плитки между начальной и конечной ячейкой
+    def paint_animation(self, painter):
+        values, paths = self.animations[0]
+        progress = self.animation_progress()
+
+        for index in range(self.grid_size * self.grid_size):
+            position = self.tile_rect(index % self.grid_size, index // self.grid_size)
+            painter.drawPixmap(position.topLeft(), self.tile_pixmap(0))
+
+        for value, start, end in paths:
+            position = self.tile_rect(start % self.grid_size, start // self.grid_size)
+            target = self.tile_rect(end % self.grid_size, end // self.grid_size)
+            painter.drawPixmap(
+                QPointF(
+                    position.x() + (target.x() - position.x()) * progress,
+                    position.y() + (target.y() - position.y()) * progress,
+                ),
+                self.tile_pixmap(value),
+            )
+
     # Отрисовка элементов
-    def paintEvent(self, painter):
+    def paintEvent(self, event):
         painter = QPainter(self)
         painter.setPen(Qt.NoPen)
         painter.setBrush(self.background)
-        painter.drawRect(self.rect())
-
-        self.block_score(painter)
-        self.block_best(painter)
+        painter.drawRect(event.rect())
 
-        painter.drawText(QRectF(20, 40, 80, 50), str(self.score))
-        painter.drawText(QRectF(110, 40, 80, 50), str(self.high_score))
-        painter.setFont(QFont("Arial", int(self.tile_size / 4)))
+        if event.rect().top() < 80:
+            self.block_score(painter)
+            self.block_best(painter)
 
-        for grid_X in range(self.grid_size):
-            for grid_Y in range(self.grid_size):
-                tile = self.tiles[grid_X][grid_Y]
+            painter.drawText(QRectF(20, 40, 80, 50), str(self.score))
+            painter.drawText(QRectF(110, 40, 80, 50), str(self.high_score))
 
-                if tile is None:
-                    painter.setBrush(self.colors_tile[0])
-                else:
-                    painter.setBrush(self.colors_tile[tile.value])
-
-                # Положение плиток
-                position = QRectF(
-                    self.tile_margin
-                    + grid_X * (self.tile_size + self.tile_margin),
-                    80 + self.tile_margin
-                    + grid_Y * (self.tile_size + self.tile_margin),
-                    self.tile_size,
-                    self.tile_size,
+            # Подсказка
+            if self.hint_text:
+                painter.setPen(self.color_dark)
+                painter.drawText(
+                    QRectF(190, 42, 140, 28), Qt.AlignCenter, self.hint_text
                 )
-                painter.setPen(Qt.NoPen)
-                painter.drawRoundedRect(position, 5.0, 5.0)  # Скругление плиток
-
-                if tile is not None:
-                    # Размер шрифта
-                    if self.grid_size == 2:
-                        font_size = 22
-                    if self.grid_size == 3:
-                        font_size = 20
-                    elif self.grid_size == 4:
-                        font_size = 18
-                    elif self.grid_size == 5:
-                        font_size = 16
-                    elif self.grid_size == 6:
-                        font_size = 14
-
-                    painter.setPen(
-                        self.color_dark if tile.value < 8 else self.color_white
-                    )
-                    painter.setFont(QFont("Arial", font_size))
-                    painter.drawText(
-                        position, Qt.AlignCenter | Qt.AlignVCenter,
-                        str(tile.value)
-                    )
+
+        if self.animations:
+            self.paint_animation(painter)
+        else:
+            self.paint_tiles(painter, event)
+
+        if self.metrics_overlay:
+            self.paint_metrics(painter)
+
+    # Рисуются только плитки, попавшие в область перерисовки
+    def paint_tiles(self, painter, event):
+        step = self.tile_size + self.tile_margin
+        cells = set()
+        for rect in event.region().rects():
+            left = rect.left() - self.board_left - self.tile_margin
+            top = rect.top() - 80 - self.tile_margin
+            right = rect.right() - self.board_left - self.tile_margin
+            bottom = rect.bottom() - 80 - self.tile_margin
+
+            columns = range(
+                max(0, int(left // step)),
+                min(self.grid_size - 1, int(right // step)) + 1,
+            )
+            rows = range(
+                max(0, int(top // step)),
+                min(self.grid_size - 1, int(bottom // step)) + 1,
+            )
+            for grid_X in columns:
+                for grid_Y in rows:
+                    cells.add((grid_X, grid_Y))
+
+        for grid_X, grid_Y in cells:
+            tile = self.tiles[grid_X][grid_Y]
+            position = self.tile_rect(grid_X, grid_Y)
+            left, top = int(position.x()), int(position.y())
+            painter.drawPixmap(
+                left,
+                top,
+                self.tile_pixmap(
+                    0 if tile is None else tile.value,
+                    position.x() - left,
+                    position.y() - top,
+                ),
+            )
+
+    # Показ и скрытие замеров; пока они видны, обновляются дважды в секунду
+    def toggle_metrics(self):
+        if self.metrics_timer is None:
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.setInterval(500)
+            self.metrics_timer.timeout.connect(self.update)
+
+        self.metrics_overlay = not self.metrics_overlay
+        if self.metrics_overlay:
+            self.metrics_timer.start()
+        else:
+            self.metrics_timer.stop()
+        self.update()
+
+    # Таблица замеров поверх поля, время в мс
+    def paint_metrics(self, painter):
+        summaries = RECORDER.summaries()
+        lines = [f"{'':<24}{'p50':>7}{'p99':>7}{'max':>8}{'n':>7}"]
+        for name, summary in summaries[: self.metrics_lines]:
+            lines.append(
+                f"{name.replace('GameView.', ''):<24.24}"
+                f"{summary['p50_ms']:>7.2f}{summary['p99_ms']:>7.2f}"
+                f"{summary['max_ms']:>8.1f}{summary['count']:>7}"
+            )
+
+        painter.setFont(QFont("Courier New", 7))
+        line_height = painter.fontMetrics().height()
+        area = QRectF(
+            self.board_left, 80, self.width() - 2 * self.board_left,
+            line_height * len(lines) + 8,
+        )
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 180))
+        painter.drawRect(area)
+        painter.setPen(self.color_white)
+        painter.drawText(area.adjusted(4, 4, -4, -4), Qt.AlignLeft, "\n".join(lines))
 
     # Вкладка "Настройки"
     def settings(self):
@@ -554,8 +1828,8 @@ class GameView(QWidget):
 
         # Поле
         spinbox = QSpinBox()
-        spinbox.setMinimum(2)
-        spinbox.setMaximum(6)
+        spinbox.setMinimum(engine.GRID_MIN)
+        spinbox.setMaximum(self.grid_max)
         spinbox.setValue(self.grid_size)
 
         # Кнопка "Сохранить"
@@ -569,6 +1843,67 @@ class GameView(QWidget):
         settings_row.addWidget(spinbox)
         settings_row.addWidget(save_button)
 
+        # Игра без остановки на 2048
+        endless_checkbox = QCheckBox("Бесконечная игра")
+        endless_checkbox.setChecked(self.endless)
+        endless_checkbox.stateChanged.connect(self.endless_apply)
+
+        # Время на подсказку
+        hint_spinbox = QSpinBox()
+        hint_spinbox.setRange(100, 5000)
+        hint_spinbox.setSingleStep(100)
+        hint_spinbox.setSuffix(" мс")
+        hint_spinbox.setValue(self.hint_time)
+        hint_spinbox.valueChanged.connect(self.hint_time_apply)
+
+        hint_row = QHBoxLayout()
+        hint_row.addWidget(QLabel("Время подсказки:"))
+        hint_row.addWidget(hint_spinbox)
+
+        # Совет сети
+        network_checkbox = QCheckBox("Совет обученной сети (4x4)")
+        network_checkbox.setChecked(self.network is not None)
+        network_checkbox.stateChanged.connect(self.network_hint_apply)
+
+        # Память под отмену ходов
+        undo_spinbox = QSpinBox()
+        undo_spinbox.setRange(16, 65536)
+        undo_spinbox.setSingleStep(256)
+        undo_spinbox.setSuffix(" КБ")
+        undo_spinbox.setValue(self.preferences.get("undo_limit"))
+        undo_spinbox.valueChanged.connect(self.undo_limit_apply)
+
+        undo_row = QHBoxLayout()
+        undo_row.addWidget(QLabel("Память отмены:"))
+        undo_row.addWidget(undo_spinbox)
+
+        # Стена зрителя
+        wall_spinbox = QSpinBox()
+        wall_spinbox.setRange(1, self.wall_max)
+        wall_spinbox.setValue(16)
+        wall_button = QPushButton("Показать")
+        wall_button.clicked.connect(lambda: self.show_wall(wall_spinbox.value()))
+
+        wall_row = QHBoxLayout()
+        wall_row.addWidget(QLabel("Партии ботов:"))
+        wall_row.addWidget(wall_spinbox)
+        wall_row.addWidget(wall_button)
+
+        # Автоигра
+        autoplay_combobox = QComboBox()
+        autoplay_combobox.addItems(self.autoplay_policies)
+        self.autoplay_button = QPushButton(
+            "Стоп" if self.autoplay is not None else "Старт"
+        )
+        self.autoplay_button.clicked.connect(
+            lambda: self.toggle_autoplay(autoplay_combobox.currentText())
+        )
+
+        autoplay_row = QHBoxLayout()
+        autoplay_row.addWidget(QLabel("Автоигра:"))
+        autoplay_row.addWidget(autoplay_combobox)
+        autoplay_row.addWidget(self.autoplay_button)
+
         music_layout = QHBoxLayout()
         music_checkbox = QCheckBox("Музыка")
         music_checkbox.setChecked(False)
@@ -587,11 +1922,26 @@ class GameView(QWidget):
         history_import.addWidget(import_data)
         history_import.addWidget(export_data)
         history_import.addWidget(history_clear)
+        self.transfer_buttons = [import_data, export_data, history_clear]
+
+        # Режим импорта и ход выполнения
+        self.merge_checkbox = QCheckBox("Добавлять к истории при импорте")
+        self.transfer_progress = QProgressBar()
+        self.transfer_progress.setRange(0, 100)
+        self.transfer_progress.hide()
 
         # Размещение элементов
         settings_layout.addLayout(history_import)
+        settings_layout.addWidget(self.merge_checkbox)
+        settings_layout.addWidget(self.transfer_progress)
         settings_layout.addLayout(settings_row)
+        settings_layout.addWidget(endless_checkbox)
+        settings_layout.addWidget(network_checkbox)
+        settings_layout.addLayout(hint_row)
+        settings_layout.addLayout(undo_row)
         settings_layout.addLayout(music_layout)
+        settings_layout.addLayout(wall_row)
+        settings_layout.addLayout(autoplay_row)
         settings_layout.addStretch()
 
         settings_widget.setLayout(settings_layout)
@@ -599,12 +1949,9 @@ class GameView(QWidget):
 
     # Очистить историю игр
     def history_clear(self):
-        connection = sqlite3.connect("files/game_history.db")
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM game_history")
-
-        connection.commit()
-        connection.close()
+        self.history_saver.flush()  # Партии из очереди тоже удаляются
+        self.history_generation += 1
+        self.storage.clear()
 
         self.clear_message = QMessageBox(
             QMessageBox.Information, "2048", "История игр очищена"
@@ -613,91 +1960,309 @@ class GameView(QWidget):
 
         self.update_history_tab()
 
-    # Импорт данных в CSV-файл
+    # Импорт данных из CSV-файла
     def import_csv(self):
-        try:
-            connection = sqlite3.connect("files/game_history.db")
-            cursor = connection.cursor()
-            cursor.execute("DELETE FROM game_history")  # Удаление существующих данных
-
-            with open("files/game_history.csv", "r", newline="") as csvfile:
-                csv_reader = csv.reader(csvfile)
-                next(csv_reader)  # Пропуск первой строки с заголовками
-
-                for row in csv_reader:
-                    result, score, best_score, timestamp = row
-                    cursor.execute(
-                        "INSERT INTO game_history (result, score, best_score, timestamp) VALUES (?, ?, ?, ?)",
-                        (result, int(score), int(best_score), timestamp),
-                    )
+        mode = "merge" if self.merge_checkbox.isChecked() else "import"
+        self.start_transfer(mode)
 
-            connection.commit()
-            connection.close()
+    # Экспорт данных в CSV-файл
+    def export_csv(self):
+        self.start_transfer("export")
+
+    # Запуск импорта/экспорта в фоновом потоке
+    def start_transfer(self, mode):
+        if self.transfer is not None:
+            return
+
+        self.history_saver.flush()  # Экспорт с последними партиями
+        if mode != "export":
+            self.history_generation += 1
+        self.transfer = HistoryTransfer(
+            self.storage.path, "files/game_history.csv", mode
+        )
+        self.transfer.progress.connect(self.transfer_progress.setValue)
+        self.transfer.done.connect(self.transfer_done)
+        self.transfer.failed.connect(self.transfer_failed)
+        self.transfer.finished.connect(self.transfer_finished)
 
-            self.import_message = QMessageBox(
-                QMessageBox.Information, "2048",
-                "Данные импортированы из файла Excel"
-            )
-            self.import_message.exec_()
+        for button in self.transfer_buttons:
+            button.setEnabled(False)
+        self.transfer_progress.setValue(0)
+        self.transfer_progress.show()
 
+        self.transfer.start()
+
+    def transfer_done(self, count):
+        if self.transfer.mode == "export":
+            text = "Данные экспортированы в файл Excel"
+        else:
+            text = f"Данные импортированы из файла Excel: {count}"
             self.update_history_tab()
-        except Exception as e:
-            self.import_message = QMessageBox(
-                QMessageBox.Critical,
-                "2048",
-                f"Произошла ошибка при импорте данных из файла Excel: {str(e)}",
-            )
-            self.import_message.exec()
 
-    # Экспорт данных в CSV-файл
-    def export_csv(self):
-        try:
-            data = [("Результат", "Очки", "Рекорд", "Дата и время")]
-            data.extend(self.data_history())
+        self.transfer_message = QMessageBox(QMessageBox.Information, "2048", text)
+        self.transfer_message.show()
 
-            with open("files/game_history.csv", "w", newline="") as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerows(data)
+    def transfer_failed(self, error):
+        if self.transfer.mode == "export":
+            text = f"Произошла ошибка при экспорте данных в файл Excel: {error}"
+        else:
+            text = f"Произошла ошибка при импорте данных из файла Excel: {error}"
+            self.update_history_tab()  # Партии, записанные во время импорта
 
-            self.export_message = QMessageBox(
-                QMessageBox.Information, "2048",
-                "Данные экспортированы в файл Excel"
-            )
-            self.export_message.exec_()
-        except Exception as e:
-            self.export_message = QMessageBox(
-                QMessageBox.Critical,
-                "2048",
-                f"Произошла ошибка при экспорте данных в файл Excel: {str(e)}",
-            )
-            self.export_message.exec()
+        self.transfer_message = QMessageBox(QMessageBox.Critical, "2048", text)
+        self.transfer_message.show()
+
+    def transfer_finished(self):
+        self.transfer.deleteLater()
+        self.transfer = None
+
+        for button in self.transfer_buttons:
+            button.setEnabled(True)
+        self.transfer_progress.hide()
 
     # Применение настройки
     def settings_apply(self, new_grid_size):
         if new_grid_size != self.grid_size:
+            self.stop_autoplay()
             self.grid_size = new_grid_size
-            self.tile_size = (
-                340 - self.tile_margin * (self.grid_size + 1)
-            ) / self.grid_size
+            self.layout_tiles()  # Плитки другого размера
+            self.record()
             self.reset_game()
 
             # Сохранение размера сетки
-            with open("files/grid.txt", "w") as file:
-                file.write(str(new_grid_size))
+            self.preferences.set("grid_size", new_grid_size)
+            self.save_preferences()
+
+    # Переключатель бесконечной игры
+    def endless_apply(self, state):
+        self.endless = state == Qt.Checked
+        if self.preferences.set("endless", self.endless):
+            self.save_preferences()
+
+    # Веса сети из ntuple.PATH, отображаемые в память; False, если их нет
+    def load_network(self):
+        import ntuple
+
+        try:
+            self.network = ntuple.load()
+        except (OSError, ValueError):
+            self.network = None
+        return self.network is not None
+
+    # Включение и выключение совета сети
+    def network_hint_apply(self, state):
+        if state == Qt.Checked and self.network is None:
+            if not self.load_network():
+                import ntuple
+
+                QMessageBox.critical(
+                    self,
+                    "2048",
+                    f"Нет весов сети в {ntuple.PATH}.\n"
+                    "Обучите её: python ntuple.py train",
+                )
+                self.sender().setChecked(False)
+                return
+            self.suggest_move()
+        elif state != Qt.Checked and self.network is not None:
+            self.network.close()
+            self.network = None
+            self.hint_text = ""
+
+        self.update_header()
+        if self.preferences.set("network_hint", self.network is not None):
+            self.save_preferences()
+
+    def toggle_autoplay(self, policy_name):
+        if self.autoplay is None:
+            self.start_autoplay(policy_name)
+        else:
+            self.stop_autoplay()
+
+    # Бот играет на поле текущего размера; партия игрока откладывается
+    def start_autoplay(self, policy_name):
+        if self.autoplay is not None:
+            return
+        self.autoplay_saved = self.undo_state()
+        self.autoplay = Autoplay(self.storage.path, self.grid_size, policy_name)
+        self.autoplay.saved.connect(self.update_history_tab)
+        self.autoplay_frame_shown = None
+        self.autoplay_rate = (time.perf_counter(), 0)
+        self.hint_text = f"Бот: {policy_name}"
+        self.autoplay.start()
+        self.autoplay_timer.start()
+        if self.autoplay_button is not None:
+            self.autoplay_button.setText("Стоп")
+        self.update_header()
+
+    # Остановка бота и возврат к партии игрока
+    def stop_autoplay(self):
+        if self.autoplay is None:
+            return
+        self.autoplay_timer.stop()
+        self.autoplay.stop()
+        self.autoplay = None
+        self.restore_state(self.autoplay_saved)
+        self.autoplay_saved = None
+        if self.autoplay_button is not None:
+            self.autoplay_button.setText("Старт")
+        self.update_header()
+
+    # Кадр автоигры: последняя позиция бота и раз в секунду - скорость
+    def autoplay_frame(self):
+        frame = self.autoplay.frame
+        if frame is not None and frame is not self.autoplay_frame_shown:
+            self.autoplay_frame_shown = frame
+            board, self.score = frame
+            self.show_cells(self.autoplay.rules.to_cells(board))
+            self.tile_spawned = None
+            self.animations.clear()
+            self.update()
+
+        now = time.perf_counter()
+        started, moves = self.autoplay_rate
+        if now - started >= 1.0:
+            rate = (self.autoplay.moves - moves) / (now - started)
+            self.autoplay_rate = (now, self.autoplay.moves)
+            self.hint_text = f"{self.autoplay.policy_name}: {rate:.0f} ход/с"
+            self.update_header()
+
+    # Окно с партиями ботов на поле текущего размера
+    def show_wall(self, count):
+        self.wall = SpectatorWall(self, count, self.grid_size)
+        self.wall.show()
+        return self.wall
+
+    # Применение времени на подсказку
+    def hint_time_apply(self, value):
+        self.hint_time = value
+        if self.preferences.set("hint_time", value):
+            self.save_preferences()
+
+    # Применение предела памяти отмены
+    def undo_limit_apply(self, value):
+        self.undo_history.set_limit(value * 1024)
+        if self.preferences.set("undo_limit", value):
+            self.save_preferences()
+
+    # Создание проигрывателя; QtMultimedia загружается только здесь
+    def create_media_player(self):
+        from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer, QMediaPlaylist
+
+        self.media_playlist = QMediaPlaylist()
+        self.media_playlist.addMedia(
+            QMediaContent(QUrl.fromLocalFile("music/1.mp3"))
+        )
+        self.media_playlist.setPlaybackMode(QMediaPlaylist.CurrentItemInLoop)
+
+        self.media_player = QMediaPlayer(self)
+        self.media_player.setPlaylist(self.media_playlist)
+        self.media_player.setVolume(50)  # Громкость
 
     # Переключатель музыки
     def toggle_music(self, state):
         if state == Qt.Checked:
+            if self.media_player is None:
+                try:
+                    self.create_media_player()
+                except ImportError as e:
+                    QMessageBox.critical(self, "2048", f"Музыка недоступна: {e}")
+                    self.sender().setChecked(False)
+                    return
             self.media_player.play()
-        else:
+        elif self.media_player is not None:
             self.media_player.stop()
 
 
+# Замер времени запуска: python main.py --startup-time
+# Печатает JSON с временем от начала импорта main до завершения импортов,
+# создания окна и первой отрисовки поля (мс) и завершает программу
+class StartupTimer(QObject):
+    def __init__(self, app, window):
+        super().__init__()
+
+        self.app = app
+        self.window = window
+        self.phases = {
+            "imports": (IMPORTED - STARTED) * 1e3,
+            "window": (time.perf_counter() - STARTED) * 1e3,
+        }
+        window.game_view.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and "first_paint" not in self.phases:
+            # Время берётся после отрисовки, отчёт - на следующем шаге цикла
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        if "first_paint" in self.phases:
+            return
+        self.phases["first_paint"] = (time.perf_counter() - STARTED) * 1e3
+        print(json.dumps({name: round(ms, 1) for name, ms in self.phases.items()}))
+        self.app.quit()
+
+
+# Замеры обработчиков (--metrics или --metrics=файл.csv/.json).
+# Обёртки ставятся на классы до создания окна
+def enable_metrics(path):
+    global RECORDER
+    import metrics
+
+    RECORDER = recorder = metrics.enable(path or metrics.PATH)
+    recorder.instrument(
+        GameView,
+        [
+            "keyPressEvent",
+            "make_move",
+            "up",
+            "down",
+            "left",
+            "right",
+            "undo_move",
+            "redo_move",
+            "update_tiles",
+            "paintEvent",
+            "update_history",
+            "finish_game",
+        ],
+    )
+    recorder.instrument(Game, ["history_game"])
+    recorder.instrument(HistoryModel, ["reload"])
+    recorder.track_latency(GameView, "keyPressEvent", "update", "paintEvent")
+
+
 if __name__ == "__main__":
+    for argument in sys.argv[1:]:
+        if argument == "--metrics" or argument.startswith("--metrics="):
+            enable_metrics(argument.partition("=")[2])
+
     app = QApplication(sys.argv)
     ex = Game()
+    if "--startup-time" in sys.argv:
+        startup_timer = StartupTimer(app, ex)
     ex.setWindowTitle("2048")
     ex.setWindowIcon(QIcon("images/logo.png"))
-    ex.show()
+
+    # --autoplay[=стратегия]: бот играет сам, для долгих прогонов сборки
+    autoplay = [
+        a.partition("=")[2]
+        for a in sys.argv[1:]
+        if a == "--autoplay" or a.startswith("--autoplay=")
+    ]
+    if autoplay:
+        import tournament
+
+        policy_name = autoplay[0] or GameView.autoplay_policies[0]
+        if policy_name not in tournament.POLICIES:
+            sys.exit(f"Неизвестная стратегия: {policy_name}")
+        ex.game_view.start_autoplay(policy_name)
+
+    # --wall=N: только стена зрителя на весь экран, для демонстраций
+    wall = [a.partition("=")[2] for a in sys.argv[1:] if a.startswith("--wall=")]
+    if wall:
+        ex.game_view.show_wall(min(int(wall[0]), GameView.wall_max)).showFullScreen()
+    else:
+        ex.show()
     app.aboutToQuit.connect(ex.close_connection)
     sys.exit(app.exec_())
@@ -0,0 +1,165 @@
+import csv
+import json
+import time
+from functools import wraps
+
+# Замеры времени обработчиков: гистограммы задержек по каждому методу.
+# Включаются флагом main.py --metrics: методы классов заменяются обёртками
+# только тогда, поэтому без флага замеры ничего не стоят.
+#
+#   python main.py --metrics              -> files/metrics.json при выходе
+#   python main.py --metrics=metrics.csv
+
+PATH = "files/metrics.json"
+BUCKETS = 32  # Корзина n: время до 2 ** n мкс (n = 0: меньше 1 мкс)
+INPUT_TO_FRAME = "input_to_frame"  # От нажатия клавиши до конца отрисовки
+
+recorder = None  # Metrics, если замеры включены
+
+
+# Гистограмма задержек с корзинами по степеням двойки
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0  # мкс
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.counts[min(int(elapsed).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    # Верхняя граница корзины, в которую попадает доля fraction вызовов, мкс
+    def percentile(self, fraction):
+        needed = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= needed:
+                return min(float(1 << bucket), self.max)
+        return self.max
+
+    # Сводка в миллисекундах
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1e3 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) / 1e3,
+            "p99_ms": self.percentile(0.99) / 1e3,
+            "max_ms": self.max / 1e3,
+        }
+
+
+class Metrics:
+    def __init__(self, path=PATH):
+        self.path = path
+        self.histograms = {}
+        self.input_pending = None  # Начало обработки текущего нажатия
+        self.input_started = None  # Нажатие, ещё не дошедшее до экрана
+
+    def add(self, name, elapsed):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(elapsed)
+
+    # Обёртка метода с замером времени вызова
+    def timed(self, name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(name, (time.perf_counter() - started) * 1e6)
+
+        return wrapper
+
+    # Замена методов класса обёртками, имя замера - "Класс.метод"
+    def instrument(self, cls, names):
+        for name in names:
+            method = getattr(cls, name)
+            setattr(cls, name, self.timed(f"{cls.__name__}.{name}", method))
+
+    # Задержка от вызова input_method до конца следующего вызова frame_method.
+    # Учитываются только нажатия, запросившие перерисовку через request_method:
+    # клавиша, которая ничего не изменила, кадра не ждёт
+    def track_latency(self, cls, input_method, request_method, frame_method):
+        on_input = getattr(cls, input_method)
+        on_request = getattr(cls, request_method)
+        on_frame = getattr(cls, frame_method)
+
+        @wraps(on_input)
+        def input_wrapper(*args, **kwargs):
+            self.input_pending = time.perf_counter()
+            try:
+                return on_input(*args, **kwargs)
+            finally:
+                self.input_pending = None
+
+        @wraps(on_request)
+        def request_wrapper(*args, **kwargs):
+            if self.input_pending is not None and self.input_started is None:
+                self.input_started = self.input_pending
+            return on_request(*args, **kwargs)
+
+        @wraps(on_frame)
+        def frame_wrapper(*args, **kwargs):
+            try:
+                return on_frame(*args, **kwargs)
+            finally:
+                if self.input_started is not None:
+                    elapsed = time.perf_counter() - self.input_started
+                    self.input_started = None
+                    self.add(INPUT_TO_FRAME, elapsed * 1e6)
+
+        setattr(cls, input_method, input_wrapper)
+        setattr(cls, request_method, request_wrapper)
+        setattr(cls, frame_method, frame_wrapper)
+
+    # Сводки по всем замерам: [(имя, сводка)] по убыванию общего времени
+    def summaries(self):
+        ordered = sorted(
+            self.histograms.items(), key=lambda item: item[1].total, reverse=True
+        )
+        return [(name, histogram.summary()) for name, histogram in ordered]
+
+    # Запись в JSON или CSV (по расширению файла)
+    def dump(self, path=None):
+        path = path or self.path
+        bounds = [1 << bucket for bucket in range(BUCKETS)]
+
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                columns = ["count", "mean_ms", "p50_ms", "p99_ms", "max_ms"]
+                writer.writerow(["name"] + columns + [f"lt_{b}us" for b in bounds])
+                for name, summary in self.summaries():
+                    writer.writerow(
+                        [name]
+                        + [summary[column] for column in columns]
+                        + self.histograms[name].counts
+                    )
+            return
+
+        report = {
+            "bucket_bounds_us": bounds,
+            "metrics": {
+                name: dict(summary, buckets=self.histograms[name].counts)
+                for name, summary in self.summaries()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+# Включение замеров; классы передаёт main.py
+def enable(path=PATH):
+    global recorder
+    recorder = Metrics(path)
+    return recorder
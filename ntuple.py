@@ -0,0 +1,292 @@
+import os
+import sys
+import mmap
+import time
+import array
+import random
+import struct
+import argparse
+
+import engine
+
+# N-tuple сеть для оценки позиций 4x4, обучаемая TD(0) на партиях с самим
+# собой (правила и появление плиток - из engine, как в GameView).
+# Оценивается поле после хода игрока до появления плитки; лучший ход -
+# максимум очков за ход плюс оценки такого поля.
+#
+# Каждый кортеж - 4 ячейки, его вес берётся из таблицы по 16 ** 4 степеням;
+# 8 поворотов и отражений кортежа делят одну таблицу.
+#
+# Файл весов читается через mmap без разбора: заголовок, ячейки кортежей
+# и таблицы float32 (little-endian) подряд, поэтому несколько процессов
+# используют одни и те же страницы памяти.
+#
+#   python ntuple.py train --games 100000
+#   python ntuple.py play --games 1000
+
+PATH = "files/ntuple.bin"
+MAGIC = b"NT48"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")  # Метка, версия, длина кортежа, кортежи, партии
+LENGTH = 4  # Ячеек в кортеже
+TABLE = 16 ** LENGTH  # Весов в таблице одного кортежа
+
+# Кортежи (ячейки x + y * 4): крайняя и внутренняя строки,
+# квадраты 2x2 в углу, у края и в центре
+TUPLES = (
+    (0, 1, 2, 3),
+    (4, 5, 6, 7),
+    (0, 1, 4, 5),
+    (1, 2, 5, 6),
+    (5, 6, 9, 10),
+)
+
+ALPHA = 0.0025  # Шаг обучения на один вес
+
+
+# Ячейка после поворота или отражения поля; 8 вариантов
+def transform(index, variant):
+    x, y = index % engine.SIZE, index // engine.SIZE
+    last = engine.SIZE - 1
+    if variant & 4:
+        x, y = y, x
+    if variant & 2:
+        x = last - x
+    if variant & 1:
+        y = last - y
+    return x + y * engine.SIZE
+
+
+# Признаки: (смещение таблицы, ячейки a, b, c, d) для всех вариантов кортежей
+def features(tuples):
+    result = []
+    for number, cells in enumerate(tuples):
+        variants = {tuple(transform(c, v) for c in cells) for v in range(8)}
+        for variant in sorted(variants):
+            result.append((number * TABLE,) + variant)
+    return result
+
+
+class Network:
+    def __init__(self, weights, tuples=TUPLES, games=0):
+        self.weights = weights  # float32: array для обучения, memoryview из mmap
+        self.tuples = tuple(tuples)
+        self.features = features(self.tuples)
+        self.games = games  # Партий обучения
+        self.mapping = None
+
+    # Оценка поля после хода (до появления плитки)
+    def value(self, board):
+        cells = [(board >> shift) & 0xF for shift in engine.SHIFTS]
+        weights = self.weights
+        total = 0.0
+        for offset, a, b, c, d in self.features:
+            total += weights[
+                offset + (cells[a] << 12 | cells[b] << 8 | cells[c] << 4 | cells[d])
+            ]
+        return total
+
+    # Сдвиг оценки поля на delta, распределённый по весам
+    def update(self, board, delta):
+        cells = [(board >> shift) & 0xF for shift in engine.SHIFTS]
+        weights = self.weights
+        for offset, a, b, c, d in self.features:
+            weights[
+                offset + (cells[a] << 12 | cells[b] << 8 | cells[c] << 4 | cells[d])
+            ] += delta
+
+    # Лучший ход: (направление, очки за ход, поле после хода, его оценка).
+    # Направление None, если ходов нет
+    def best_move(self, board):
+        best = (None, 0, board, 0.0)
+        for direction in engine.DIRECTIONS:
+            moved, score = engine.move(board, direction)
+            if moved == board:
+                continue
+            value = self.value(moved)
+            if best[0] is None or score + value > best[1] + best[3]:
+                best = (direction, score, moved, value)
+        return best
+
+    # Запись через временный файл и переименование
+    def save(self, path=PATH):
+        cells = bytes(c for cells in self.tuples for c in cells)
+        padding = bytes(-(HEADER.size + len(cells)) % 4)
+
+        weights = array.array("f", self.weights)
+        if sys.byteorder != "little":
+            weights.byteswap()
+
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(
+                HEADER.pack(MAGIC, VERSION, LENGTH, len(self.tuples), self.games)
+            )
+            file.write(cells + padding)
+            weights.tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    def close(self):
+        if self.mapping is not None:
+            self.weights.release()
+            self.mapping.close()
+            self.mapping = None
+
+
+# Новая сеть с нулевыми весами
+def create(tuples=TUPLES):
+    return Network(array.array("f", bytes(4 * TABLE * len(tuples))), tuples)
+
+
+# Сеть из файла. writable=False - веса отображаются в память только для
+# чтения; True - копируются в массив для дообучения
+def load(path=PATH, writable=False):
+    with open(path, "rb") as file:
+        data = file.read(HEADER.size)
+        if len(data) < HEADER.size:
+            raise ValueError("Файл весов обрывается")
+        magic, version, length, count, games = HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION or length != LENGTH:
+            raise ValueError("Неизвестный формат файла весов")
+
+        tuples = struct.unpack(f"{count * length}B", file.read(count * length))
+        tuples = [tuples[i : i + length] for i in range(0, len(tuples), length)]
+        offset = HEADER.size + count * length
+        offset += -offset % 4
+        size = offset + 4 * TABLE * count
+        if os.fstat(file.fileno()).st_size != size:
+            raise ValueError("Размер файла весов не совпадает с заголовком")
+
+        if writable or sys.byteorder != "little":
+            file.seek(offset)
+            weights = array.array("f")
+            weights.fromfile(file, TABLE * count)
+            if sys.byteorder != "little":
+                weights.byteswap()
+            return Network(weights, tuples, games)
+
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    network = Network(memoryview(mapping)[offset:size].cast("f"), tuples, games)
+    network.mapping = mapping
+    return network
+
+
+# Одна партия обучения без остановки на 2048: (очки, наибольшая степень).
+# Оценка поля после хода тянется к очкам следующего хода плюс оценке
+# следующего поля после хода; после последнего хода - к нулю
+def train_game(network, rng, alpha=ALPHA):
+    board = engine.new_board(rng)
+    score = 0
+    previous = None
+
+    while True:
+        direction, gained, moved, value = network.best_move(board)
+        if direction is None:
+            break
+
+        if previous is not None:
+            error = gained + value - network.value(previous)
+            network.update(previous, alpha * error)
+        previous = moved
+
+        score += gained
+        board = engine.add_tile(moved, rng)
+
+    if previous is not None:
+        network.update(previous, -alpha * network.value(previous))
+    network.games += 1
+    return score, engine.max_exponent(board)
+
+
+# Партия по сети без обучения: (очки, наибольшая степень)
+def play_game(network, rng):
+    board = engine.new_board(rng)
+    score = 0
+    while True:
+        direction, gained, moved, value = network.best_move(board)
+        if direction is None:
+            return score, engine.max_exponent(board)
+        score += gained
+        board = engine.add_tile(moved, rng)
+
+
+# Сводка по серии партий
+def report(results, elapsed, prefix=""):
+    games = len(results)
+    mean = sum(score for score, exponent in results) / games
+    rates = "  ".join(
+        f"{1 << exponent}: {sum(e >= exponent for s, e in results) / games:.1%}"
+        for exponent in (engine.WIN_EXPONENT, engine.WIN_EXPONENT + 1)
+    )
+    print(
+        f"{prefix}ср. счёт {mean:.0f}  {rates}  {games / elapsed:.1f} партий/с",
+        flush=True,
+    )
+
+
+def train(args):
+    if args.resume and os.path.exists(args.weights):
+        network = load(args.weights, writable=True)
+    else:
+        network = create()
+    rng = random.Random(args.seed)
+
+    results = []
+    started = time.perf_counter()
+    for number in range(1, args.games + 1):
+        results.append(train_game(network, rng, args.alpha))
+
+        if number % args.report == 0 or number == args.games:
+            report(
+                results,
+                time.perf_counter() - started,
+                f"{network.games:>8} партий: ",
+            )
+            results = []
+            started = time.perf_counter()
+        if number % args.save == 0 or number == args.games:
+            network.save(args.weights)
+
+
+def play(args):
+    network = load(args.weights)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    results = [play_game(network, rng) for _ in range(args.games)]
+    report(results, time.perf_counter() - started, f"Обучена на {network.games}: ")
+    network.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="N-tuple сеть для 2048")
+    parser.add_argument("mode", choices=["train", "play"])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--weights", default=PATH)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument(
+        "--resume", action="store_true", help="дообучить сеть из файла весов"
+    )
+    parser.add_argument(
+        "--report", type=int, default=1000, help="партий между сводками"
+    )
+    parser.add_argument(
+        "--save", type=int, default=10000, help="партий между записями весов"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.mode == "train":
+        train(args)
+    else:
+        play(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import json
+
+# Настройки и состояние программы: значения хранятся в памяти,
+# изменённые записываются в файл целиком через временный файл и
+# переименование, поэтому при сбое остаётся прежняя версия файла.
+# Когда записывать, решает вызывающий код (таймер в GameView и выход).
+
+PATH = "files/settings.json"
+LEGACY_GRID = "files/grid.txt"
+LEGACY_RECORD = "files/record.txt"
+
+DEFAULTS = {
+    "grid_size": 4,
+    "hint_time": 500,  # Время на поиск подсказки, мс
+    "undo_limit": 1024,  # Память под историю отмены ходов, КБ
+    "endless": False,  # Продолжение игры после плитки 2048
+    "network_hint": False,  # Совет n-tuple сети после каждого хода
+    "high_scores": {},  # Размер поля (строкой) -> рекорд
+}
+
+
+class Preferences:
+    def __init__(self, path=PATH):
+        self.path = path
+        self.values = dict(DEFAULTS)
+        self.dirty = set()  # Ключи, изменённые после последней записи
+
+        self.load()
+
+    # Чтение файла; при первом запуске - перенос grid.txt и record.txt
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.values.update(json.load(file))
+            return
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            return  # Повреждённый файл заменится при следующей записи
+
+        grid_size = read_number(LEGACY_GRID)
+        if grid_size is not None:
+            self.set("grid_size", grid_size)
+
+        record = read_number(LEGACY_RECORD)
+        if record:
+            # Старый рекорд был общим, он относится к текущему размеру поля
+            self.set_high_score(self.get("grid_size"), record)
+
+    def get(self, key):
+        return self.values.get(key, DEFAULTS.get(key))
+
+    # Изменение значения, True - если оно действительно изменилось
+    def set(self, key, value):
+        if self.values.get(key) == value:
+            return False
+        self.values[key] = value
+        self.dirty.add(key)
+        return True
+
+    def high_score(self, grid_size):
+        return self.get("high_scores").get(str(grid_size), 0)
+
+    # Новый рекорд для размера поля, True - если он выше прежнего
+    def set_high_score(self, grid_size, score):
+        if score <= self.high_score(grid_size):
+            return False
+        high_scores = dict(self.get("high_scores"))
+        high_scores[str(grid_size)] = score
+        return self.set("high_scores", high_scores)
+
+    # Запись изменённых значений
+    def flush(self):
+        if not self.dirty:
+            return
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.values, file, ensure_ascii=False, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+        self.dirty.clear()
+
+
+# Число из файла старого формата или None
+def read_number(path):
+    try:
+        with open(path, "r") as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return None
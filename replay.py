@@ -0,0 +1,221 @@
+import struct
+
+import engine
+
+# Запись партии в компактном двоичном виде и её воспроизведение.
+#
+# Заголовок: версия, размер поля, число начальных плиток, флаги, число ходов.
+# Далее поток битов (младшие биты первыми):
+#   плитка - 1 бит значения (0: 2, 1: 4) и номер ячейки x + y * size;
+#   ход    - 2 бита направления engine.DIRECTIONS и появившаяся плитка.
+# На поле 4x4 ход занимает 7 бит. После выигрышного хода плитка
+# не появляется, это отмечено флагом FINAL_WITHOUT_SPAWN.
+
+VERSION = 1
+HEADER = struct.Struct("<BBBBI")
+FINAL_WITHOUT_SPAWN = 1
+
+SNAPSHOT_INTERVAL = 64  # Ходов между сохранёнными позициями при перемотке
+
+
+# Бит на номер ячейки для поля size x size
+def cell_bits(size):
+    return (size * size - 1).bit_length()
+
+
+# Поток битов с перемещением конца записи: seek назад не стирает данные,
+# поэтому к ним можно вернуться, пока не записано что-то новое
+class BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.length = 0  # Бит в записи
+        self.written = 0  # Бит записано, включая оставшиеся после seek
+
+    def write(self, value, bits):
+        if self.written > self.length:
+            self.truncate()
+
+        offset = self.length >> 3
+        value <<= self.length & 7
+        self.length += bits
+        self.written = self.length
+        self.data.extend(bytes(((self.length + 7) >> 3) - len(self.data)))
+
+        while value:
+            self.data[offset] |= value & 0xFF
+            value >>= 8
+            offset += 1
+
+    def tell(self):
+        return self.length
+
+    def seek(self, position):
+        if position > self.written:
+            raise ValueError("Положение за концом записи")
+        self.length = position
+
+    # Отбрасывание данных после конца записи
+    def truncate(self):
+        del self.data[(self.length + 7) >> 3 :]
+        if self.length & 7:
+            self.data[-1] &= (1 << (self.length & 7)) - 1
+        self.written = self.length
+
+    def getvalue(self):
+        data = bytearray(self.data[: (self.length + 7) >> 3])
+        if self.length & 7:
+            data[-1] &= (1 << (self.length & 7)) - 1
+        return bytes(data)
+
+
+class BitReader:
+    def __init__(self, data):
+        self.data = bytes(data) + b"\0\0"  # Чтение двумя байтами без проверки конца
+        self.position = 0
+
+    # Не больше 9 бит за раз
+    def read(self, bits):
+        offset = self.position >> 3
+        value = int.from_bytes(self.data[offset : offset + 2], "little")
+        value = (value >> (self.position & 7)) & ((1 << bits) - 1)
+        self.position += bits
+        if self.position > (len(self.data) - 2) * 8:
+            raise ValueError("Запись партии обрывается")
+        return value
+
+
+# Запись партии по мере игры
+class GameLog:
+    def __init__(self, size):
+        self.size = size
+        self.cell_bits = cell_bits(size)
+        self.writer = BitWriter()
+        self.initial = 0  # Плиток до первого хода
+        self.moves = 0
+        self.spawn_pending = False  # Последний ход ещё без плитки
+
+    # Плитка степени exponent в ячейке index
+    def spawn(self, index, exponent):
+        self.writer.write(exponent - 1, 1)
+        self.writer.write(index, self.cell_bits)
+        if self.moves:
+            self.spawn_pending = False
+        else:
+            self.initial += 1
+
+    def move(self, direction):
+        self.writer.write(direction, 2)
+        self.moves += 1
+        self.spawn_pending = True
+
+    # Положение записи для отмены хода
+    def mark(self):
+        return self.writer.tell(), self.moves, self.spawn_pending
+
+    # Возврат к положению mark(); следующий ход перезапишет всё после него
+    def rewind(self, mark):
+        position, self.moves, self.spawn_pending = mark
+        self.writer.seek(position)
+
+    def encode(self):
+        flags = FINAL_WITHOUT_SPAWN if self.spawn_pending else 0
+        return (
+            HEADER.pack(VERSION, self.size, self.initial, flags, self.moves)
+            + self.writer.getvalue()
+        )
+
+
+# Запись партии, которая продолжает сохранённую encode()
+def restore(data):
+    size, spawns, moves = decode(data)
+    log = GameLog(size)
+    for index, exponent in spawns:
+        log.spawn(index, exponent)
+    for direction, spawn in moves:
+        log.move(direction)
+        if spawn is not None:
+            log.spawn(*spawn)
+    return log
+
+
+# Разбор записи: (размер, начальные плитки, ходы).
+# Плитка - (ячейка, степень), ход - (направление, плитка или None)
+def decode(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Запись партии обрывается")
+    version, size, initial, flags, moves = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Неизвестная версия записи партии: {version}")
+
+    reader = BitReader(data[HEADER.size :])
+    bits = cell_bits(size)
+
+    def spawn():
+        exponent = reader.read(1) + 1
+        return reader.read(bits), exponent
+
+    spawns = [spawn() for _ in range(initial)]
+    log = []
+    for number in range(moves):
+        direction = reader.read(2)
+        last = number == moves - 1
+        if last and flags & FINAL_WITHOUT_SPAWN:
+            log.append((direction, None))
+        else:
+            log.append((direction, spawn()))
+
+    return size, spawns, log
+
+
+# Воспроизведение с перемоткой: позиция через каждые SNAPSHOT_INTERVAL
+# ходов хранится, остальные получаются не больше чем за интервал ходов
+class Replay:
+    def __init__(self, data, interval=SNAPSHOT_INTERVAL):
+        self.size, spawns, self.log = decode(data)
+        # Кортежи, а не битборд: в бесконечной игре степени бывают больше 15
+        self.rules = engine.Grid(self.size)
+        self.interval = interval
+
+        board = self.rules.from_cells([0] * (self.size * self.size))
+        for index, exponent in spawns:
+            board = self.place(board, index, exponent)
+
+        # Проход по всей партии с проверкой каждого хода
+        self.snapshots = []  # (поле, счёт) перед ходом number * interval
+        score = 0
+        for number, (direction, spawn) in enumerate(self.log):
+            if number % interval == 0:
+                self.snapshots.append((board, score))
+            moved, gained = self.rules.move(board, direction)
+            if moved == board:
+                raise ValueError(f"Ход {number + 1} не меняет поле")
+            board, score = moved, score + gained
+            if spawn is not None:
+                board = self.place(board, *spawn)
+
+        self.final = (board, score)
+
+    # Плитка в пустой ячейке
+    def place(self, board, index, exponent):
+        if self.rules.to_cells(board)[index]:
+            raise ValueError(f"Плитка в занятой ячейке {index}")
+        return self.rules.place(board, index, exponent)
+
+    # Число ходов; позиции - от 0 до len(replay)
+    def __len__(self):
+        return len(self.log)
+
+    # Позиция после number ходов: (степени ячеек x + y * size, счёт)
+    def position(self, number):
+        number = max(0, min(number, len(self.log)))
+        if number == len(self.log):
+            board, score = self.final
+        else:
+            start = number - number % self.interval
+            board, score = self.snapshots[start // self.interval]
+            for direction, spawn in self.log[start:number]:
+                board, gained = self.rules.move(board, direction)
+                score += gained
+                if spawn is not None:
+                    board = self.rules.place(board, *spawn)
+        return self.rules.to_cells(board), score
@@ -0,0 +1,277 @@
+import sys
+import json
+import random
+import signal
+import asyncio
+import argparse
+
+import engine
+import storage
+from tournament import HistoryWriter
+
+# Игровой сервер без интерфейса: тысячи партий в одном процессе.
+# Протокол - строки JSON по TCP, один запрос - одна строка, ответы
+# приходят в порядке запросов, поэтому запросы можно слать пачками:
+#
+#   {"op": "new", "size": 4}                -> состояние новой партии
+#   {"op": "move", "id": 1, "direction": "up"}
+#   {"op": "state", "id": 1}
+#   {"op": "close", "id": 1}
+#
+# Партии соединения удаляются, когда клиент отключается, даже без close.
+#
+# Состояние: {"id", "size", "cells", "score", "moves", "moved", "result"},
+# cells - степени двойки в ячейках x + y * size (0 - пусто),
+# result - None, пока партия идёт. Ошибка: {"error": "..."}.
+#
+#   python server.py --port 2048
+
+HOST = "127.0.0.1"
+PORT = 2048
+MAX_SESSIONS = 100000
+READ_SIZE = 1 << 16  # Байт за одно чтение из сокета
+MAX_LINE = 1 << 16  # Предел длины запроса
+FLUSH_INTERVAL = 1.0  # Запись законченных партий не реже, с
+
+# Ответы в ASCII без пробелов: так работает быстрый кодировщик на C
+ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+DIRECTION_NAMES = {
+    "up": engine.UP,
+    "down": engine.DOWN,
+    "left": engine.LEFT,
+    "right": engine.RIGHT,
+}
+
+
+# Ошибка в запросе, передаётся клиенту
+class RequestError(Exception):
+    pass
+
+
+# Партия: поле в виде битборда (4x4) или кортежа степеней
+class Session:
+    __slots__ = ("rules", "board", "score", "moves", "result")
+
+    def __init__(self, rules, board):
+        self.rules = rules
+        self.board = board
+        self.score = 0
+        self.moves = 0
+        self.result = None
+
+
+class GameServer:
+    def __init__(self, history=None, seed=None, max_sessions=MAX_SESSIONS):
+        self.history = history  # HistoryWriter или None
+        self.rng = random.Random(seed)
+        self.max_sessions = max_sessions
+
+        self.sessions = {}
+        self.next_id = 1
+        self.rules = {}  # Размер поля -> общие для всех партий правила
+        self.operations = {
+            "new": self.new_game,
+            "move": self.move,
+            "state": self.state,
+            "close": self.close_game,
+        }
+
+    async def start(self, host=HOST, port=PORT):
+        self.flush_task = asyncio.ensure_future(self.flush_periodically())
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.flush_task.cancel()
+        if self.history is not None:
+            self.history.close()
+
+    # Соединение: все полные строки из прочитанного блока обрабатываются
+    # сразу, ответы отправляются одной записью
+    async def handle(self, reader, writer):
+        buffer = b""
+        owned = set()  # id партий, созданных этим соединением
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                if len(buffer) > MAX_LINE:
+                    writer.write(self.encode({"error": "Слишком длинный запрос"}))
+                    break
+                responses = [
+                    self.respond(line, owned) for line in lines if line.strip()
+                ]
+                if responses:
+                    writer.write(b"".join(responses))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            for session_id in owned:
+                self.sessions.pop(session_id, None)  # Если ещё не закрыта
+
+    # Ответ на одну строку запроса
+    def respond(self, line, owned):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            return self.encode({"error": "Запрос должен быть объектом JSON"})
+
+        try:
+            operation = self.operations.get(str(request.get("op")))
+            if operation is None:
+                raise RequestError(f"Неизвестная операция: {request.get('op')}")
+            return self.encode(operation(request, owned))
+        except RequestError as e:
+            return self.encode({"error": str(e)})
+        except Exception as e:
+            # Ошибка в одном запросе не обрывает остальные ответы пачки
+            return self.encode({"error": f"Внутренняя ошибка: {e!r}"})
+
+    def encode(self, response):
+        return ENCODER.encode(response).encode() + b"\n"
+
+    def session(self, request):
+        session_id = request.get("id")
+        if type(session_id) is not int or session_id not in self.sessions:
+            raise RequestError(f"Нет партии {session_id}")
+        return self.sessions[session_id]
+
+    # Новая партия, как в GameView.reset_game
+    def new_game(self, request, owned):
+        size = request.get("size", engine.SIZE)
+        if not isinstance(size, int) or not engine.GRID_MIN <= size <= engine.GRID_MAX:
+            raise RequestError(
+                f"Размер поля должен быть от {engine.GRID_MIN} до {engine.GRID_MAX}"
+            )
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("Слишком много партий")
+
+        if size not in self.rules:
+            self.rules[size] = engine.rules(size)
+        rules = self.rules[size]
+
+        session_id = self.next_id
+        self.next_id += 1
+        self.sessions[session_id] = Session(rules, rules.new_board(self.rng))
+        owned.add(session_id)
+        return self.describe(session_id, self.sessions[session_id], False)
+
+    # Ход по правилам GameView.up/down/left/right и add_tile
+    def move(self, request, owned):
+        session = self.session(request)
+        direction = request.get("direction")
+        if isinstance(direction, str):
+            direction = DIRECTION_NAMES.get(direction)
+        if type(direction) is not int or direction not in engine.DIRECTIONS:
+            raise RequestError(f"Неизвестное направление: {request.get('direction')}")
+        if session.result is not None:
+            raise RequestError("Партия окончена")
+
+        rules = session.rules
+        moved, gained = rules.move(session.board, direction)
+        if moved == session.board:
+            return self.describe(request["id"], session, False)
+
+        session.board = rules.add_tile(moved, self.rng)
+        session.score += gained
+        session.moves += 1
+
+        # Окончание игры, как в GameView.update_tiles
+        cells = rules.to_cells(session.board)
+        if max(cells) >= engine.WIN_EXPONENT:
+            self.finish(session, storage.WIN)
+        elif 0 not in cells and not rules.moves_available(session.board):
+            self.finish(session, storage.LOSS)
+
+        return self.describe(request["id"], session, True, cells)
+
+    def state(self, request, owned):
+        session = self.session(request)
+        return self.describe(request["id"], session, False)
+
+    # Удаление партии; незаконченная в историю не попадает
+    def close_game(self, request, owned):
+        self.session(request)
+        del self.sessions[request["id"]]
+        owned.discard(request["id"])
+        return {"id": request["id"], "closed": True}
+
+    def finish(self, session, result):
+        session.result = result
+        if self.history is not None:
+            self.history.add(result, session.score, session.rules.size)
+
+    def describe(self, session_id, session, moved, cells=None):
+        if cells is None:
+            cells = session.rules.to_cells(session.board)
+        return {
+            "id": session_id,
+            "size": session.rules.size,
+            "cells": cells,
+            "score": session.score,
+            "moves": session.moves,
+            "moved": moved,
+            "result": session.result,
+        }
+
+    # Законченные партии копятся в HistoryWriter пачками; при редких
+    # партиях они всё равно записываются раз в FLUSH_INTERVAL
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if self.history is not None:
+                self.history.flush()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Игровой сервер 2048")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--database", default=storage.DATABASE)
+    parser.add_argument(
+        "--no-history", action="store_true",
+        help="не записывать партии в историю игр",
+    )
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    history = None if args.no_history else HistoryWriter(args.database)
+    game_server = GameServer(history, args.seed, args.max_sessions)
+    server = await game_server.start(args.host, args.port)
+    print(f"Сервер 2048 на {args.host}:{args.port}")
+
+    # Остановка по SIGTERM с записью законченных партий (кроме Windows)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    except (NotImplementedError, AttributeError):
+        pass
+
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        game_server.close()
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import struct
+import threading
+
+# Снимок незаконченной партии для продолжения после перезапуска.
+#
+# Заголовок: метка, версия, размер поля, счёт, длины записи партии
+# и состояния генератора. Далее степени ячеек x + y * size по байту,
+# порядок пустых ячеек в BoardIndex.empty (по байту на пустую ячейку),
+# запись партии (replay.GameLog.encode) и состояние random.Random
+# GameView. Порядок пустых ячеек и генератор вместе дают те же плитки
+# после продолжения, что и без перерыва. Снимки версии 1 - без порядка.
+#
+# Снимки пишет фоновый поток: из очереди берётся только последний,
+# файл заменяется через временный файл и переименование.
+
+PATH = "files/snapshot.bin"
+MAGIC = b"S048"
+VERSION = 2
+HEADER = struct.Struct("<4sBBxxQII")
+RNG_STATE = struct.Struct("<625I")  # Mersenne Twister: 624 слова и позиция
+RNG_VERSION = 3  # Версия состояния random.Random.getstate()
+
+
+def encode(size, cells, score, empty, log, rng_state):
+    version, words, gauss = rng_state
+    state = RNG_STATE.pack(*words)
+    return (
+        HEADER.pack(MAGIC, VERSION, size, score, len(log), len(state))
+        + bytes(cells)
+        + bytes(empty)
+        + log
+        + state
+    )
+
+
+# Разбор снимка: (размер, степени ячеек, счёт, порядок пустых ячеек
+# или None для версии 1, запись партии, состояние rng)
+def decode(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Снимок обрывается")
+    magic, version, size, score, log_length, state_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version not in (1, VERSION) or state_length != RNG_STATE.size:
+        raise ValueError("Неизвестный формат снимка")
+
+    offset = HEADER.size
+    cells = data[offset : offset + size * size]
+    offset += size * size
+    empty = None
+    if version >= 2:
+        empty = list(data[offset : offset + cells.count(0)])
+        offset += len(empty)
+        if sorted(empty) != [i for i, exponent in enumerate(cells) if not exponent]:
+            raise ValueError("Порядок пустых ячеек не совпадает с полем")
+    if len(data) != offset + log_length + state_length:
+        raise ValueError("Размер снимка не совпадает с заголовком")
+
+    log = data[offset : offset + log_length]
+    words = RNG_STATE.unpack_from(data, offset + log_length)
+    return size, cells, score, empty, log, (RNG_VERSION, words, None)
+
+
+# Снимок из файла или None, если его нет или он повреждён
+def read(path=PATH):
+    try:
+        with open(path, "rb") as file:
+            return decode(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write(path, data):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+# Фоновая запись снимков; submit не ждёт диска
+class Writer(threading.Thread):
+    def __init__(self, path=PATH):
+        super().__init__(daemon=True)
+
+        self.path = path
+        self.pending = None  # Последний ещё не записанный снимок
+        self.closed = False
+        self.condition = threading.Condition()
+        self.start()
+
+    # Новый снимок заменяет ещё не записанный
+    def submit(self, data):
+        with self.condition:
+            self.pending = data
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                data, self.pending = self.pending, None
+
+            try:
+                write(self.path, data)
+            except OSError:
+                pass  # Следующий снимок попробует снова
+
+    # Запись оставшегося снимка и остановка потока
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.join()
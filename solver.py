@@ -0,0 +1,287 @@
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import engine
+
+# Expectimax-поиск лучшего хода для подсказки.
+# Поле 4x4 обрабатывается на битборде engine, остальные размеры -
+# кортежами степеней (индекс ячейки x + y * size).
+
+SPAWNS = ((1, 0.9), (2, 0.1))  # Плитки из GameView.add_tile: 2 => 90%, 4 => 10%
+
+PROB_CUTOFF = 0.0001  # Маловероятные ветви не раскрываются
+CACHE_SIZE = 200000  # Предел таблицы транспозиций
+
+# Веса эвристики
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+
+
+# Эвристическая оценка одной линии
+def line_heuristic(line):
+    empty = merges = counter = prev = 0
+    total = 0.0
+
+    for exponent in line:
+        total += exponent ** SUM_POWER
+        if exponent == 0:
+            empty += 1
+        else:
+            if prev == exponent:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            prev = exponent
+    if counter > 0:
+        merges += 1 + counter
+
+    mono_left = mono_right = 0.0
+    for a, b in zip(line, line[1:]):
+        if a > b:
+            mono_left += a ** MONOTONICITY_POWER - b ** MONOTONICITY_POWER
+        else:
+            mono_right += b ** MONOTONICITY_POWER - a ** MONOTONICITY_POWER
+
+    return (
+        LOST_PENALTY
+        + EMPTY_WEIGHT * empty
+        + MERGES_WEIGHT * merges
+        - MONOTONICITY_WEIGHT * min(mono_left, mono_right)
+        - SUM_WEIGHT * total
+    )
+
+
+# Правила на битборде (поле 4x4)
+class BitboardRules(engine.Bitboard):
+    _row_heuristic = None
+    _row_reverse = None
+
+    def __init__(self):
+        # Таблицы строятся один раз на процесс
+        if BitboardRules._row_heuristic is None:
+            BitboardRules._row_heuristic = [
+                line_heuristic([(row >> (4 * i)) & 0xF for i in range(4)])
+                for row in range(65536)
+            ]
+            BitboardRules._row_reverse = [
+                engine.reverse_row(row) for row in range(65536)
+            ]
+
+    def _rows_heuristic(self, board):
+        table = self._row_heuristic
+        return (
+            table[board & 0xFFFF]
+            + table[(board >> 16) & 0xFFFF]
+            + table[(board >> 32) & 0xFFFF]
+            + table[(board >> 48) & 0xFFFF]
+        )
+
+    def heuristic(self, board):
+        return (
+            self._rows_heuristic(board)
+            + self._rows_heuristic(engine.transpose(board))
+        )
+
+    # Отражение каждой строки
+    def _mirror(self, board):
+        table = self._row_reverse
+        return (
+            table[board & 0xFFFF]
+            | table[(board >> 16) & 0xFFFF] << 16
+            | table[(board >> 32) & 0xFFFF] << 32
+            | table[(board >> 48) & 0xFFFF] << 48
+        )
+
+    # Перестановка строк в обратном порядке
+    def _flip(self, board):
+        return (
+            (board & 0xFFFF) << 48
+            | ((board >> 16) & 0xFFFF) << 32
+            | ((board >> 32) & 0xFFFF) << 16
+            | board >> 48
+        )
+
+    # Представитель класса из 8 поворотов и отражений
+    def canonical(self, board):
+        transposed = engine.transpose(board)
+        best = board
+        for variant in (board, transposed):
+            mirrored = self._mirror(variant)
+            best = min(
+                best,
+                variant,
+                mirrored,
+                self._flip(variant),
+                self._flip(mirrored),
+            )
+        return best
+
+
+# Правила для полей произвольного размера
+class GridRules(engine.Grid):
+    def __init__(self, size):
+        super().__init__(size)
+
+        # Перестановки ячеек для 8 поворотов и отражений
+        last = size - 1
+        self.symmetries = [
+            [transform(x, y) for y in range(size) for x in range(size)]
+            for transform in (
+                lambda x, y: x + y * size,
+                lambda x, y: (last - x) + y * size,
+                lambda x, y: x + (last - y) * size,
+                lambda x, y: (last - x) + (last - y) * size,
+                lambda x, y: y + x * size,
+                lambda x, y: (last - y) + x * size,
+                lambda x, y: y + (last - x) * size,
+                lambda x, y: (last - y) + (last - x) * size,
+            )
+        ]
+
+    def heuristic(self, board):
+        return sum(
+            _line_heuristic(tuple([board[i] for i in line]))
+            for line in self.rows + self.columns
+        )
+
+    def canonical(self, board):
+        return min(
+            tuple([board[i] for i in permutation])
+            for permutation in self.symmetries
+        )
+
+
+@lru_cache(maxsize=1 << 16)
+def _line_heuristic(line):
+    return line_heuristic(line)
+
+
+# Правила с эвристикой для заданного размера поля
+def rules(size):
+    if size == engine.SIZE:
+        return BitboardRules()
+    return GridRules(size)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# Поиск с ограничением глубины и времени
+class Expectimax:
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # canonical -> (глубина, оценка, прирост очков)
+        self.rules = {}
+        self.deadline = None
+
+    # wide - степени не помещаются в 4 бита битборда
+    def _rules(self, size, wide=False):
+        if (size, wide) not in self.rules:
+            self.rules[size, wide] = GridRules(size) if wide else rules(size)
+        return self.rules[size, wide]
+
+    # Лучший ход для GameView.tiles: (направление, ожидаемый прирост, глубина).
+    # Направление None, если ходов нет
+    def search(self, tiles, time_limit=0.5, max_depth=8):
+        size = len(tiles)
+        cells = [
+            0 if tiles[x][y] is None else tiles[x][y].value.bit_length() - 1
+            for y in range(size)
+            for x in range(size)
+        ]
+        return self.search_board(cells, size, time_limit, max_depth)
+
+    # То же для списка степеней (индекс x + y * size)
+    def search_board(self, cells, size, time_limit=0.5, max_depth=8):
+        rules = self._rules(size, max(cells) >= engine.MAX_EXPONENT)
+        board = rules.from_cells(cells)
+        self.deadline = time.perf_counter() + time_limit
+
+        result = (None, 0.0, 0)
+        for depth in range(1, max_depth + 1):
+            try:
+                direction, gain = self._root(rules, board, depth)
+            except SearchTimeout:
+                break
+            result = (direction, gain, depth)
+            if direction is None:
+                break
+
+        return result
+
+    def _root(self, rules, board, depth):
+        best = None
+        for direction in engine.DIRECTIONS:
+            moved, score = rules.move(board, direction)
+            if moved == board:
+                continue
+
+            value, gain = self._chance_node(rules, moved, depth, 1.0)
+            if best is None or value > best[0]:
+                best = (value, gain + score, direction)
+
+        if best is None:
+            return None, 0.0
+        return best[2], best[1]
+
+    # Ход игрока: максимум по направлениям
+    def _max_node(self, rules, board, depth, prob):
+        key = rules.canonical(board)
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] >= depth:
+            self.cache.move_to_end(key)
+            return entry[1], entry[2]
+
+        best_value = 0.0  # Конец игры
+        best_gain = 0.0
+        found = False
+        for direction in engine.DIRECTIONS:
+            moved, score = rules.move(board, direction)
+            if moved == board:
+                continue
+
+            value, gain = self._chance_node(rules, moved, depth, prob)
+            if not found or value > best_value:
+                best_value, best_gain = value, gain + score
+                found = True
+
+        self.cache[key] = (depth, best_value, best_gain)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)  # Вытеснение самой старой записи
+
+        return best_value, best_gain
+
+    # Появление плитки: среднее по исходам add_tile
+    def _chance_node(self, rules, board, depth, prob):
+        if depth <= 1 or prob < PROB_CUTOFF:
+            return rules.heuristic(board), 0.0
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        cells = rules.empty(board)
+        if not cells:
+            return rules.heuristic(board), 0.0
+
+        total_value = total_gain = 0.0
+        cell_prob = prob / len(cells)
+        for index in cells:
+            for exponent, chance in SPAWNS:
+                value, gain = self._max_node(
+                    rules,
+                    rules.place(board, index, exponent),
+                    depth - 1,
+                    cell_prob * chance,
+                )
+                total_value += chance * value
+                total_gain += chance * gain
+
+        return total_value / len(cells), total_gain / len(cells)
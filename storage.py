@@ -0,0 +1,537 @@
+import os
+import csv
+import sqlite3
+from datetime import datetime
+
+# Хранилище истории игр: одно соединение на процесс, WAL-журнал,
+# версионируемая схема. Запросы заданы константами, поэтому sqlite3
+# переиспользует подготовленные выражения из кэша соединения.
+
+DATABASE = "files/game_history.db"
+SCHEMA_VERSION = 4
+BUSY_TIMEOUT = 60  # Ожидание чужой записи (например, импорта), с
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Хранение: сортируется как строка
+DISPLAY_FORMAT = "%d-%m-%Y %H:%M:%S"  # Отображение и CSV
+
+WIN = "Выигрыш"  # Результат выигранной партии
+LOSS = "Проигрыш"  # Результат проигранной партии
+
+SQL_INSERT = """
+    INSERT INTO game_history (result, score, best_score, timestamp, grid_size)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SQL_SELECT = "SELECT id, result, score, best_score, timestamp FROM game_history"
+SQL_GAME = SQL_SELECT + " WHERE id = ?"
+SQL_HISTORY = """
+    SELECT result, score, best_score, timestamp, grid_size
+    FROM game_history ORDER BY id
+"""
+SQL_COUNT = "SELECT COALESCE(SUM(games), 0) FROM stats_size"  # Без обхода истории
+SQL_BEST = "SELECT COALESCE(MAX(score), 0) FROM game_history"
+SQL_CLEAR = "DELETE FROM game_history"
+SQL_LOG_INSERT = "INSERT INTO game_log (game_id, log) VALUES (?, ?)"
+SQL_LOG = "SELECT log FROM game_log WHERE game_id = ?"
+SQL_CLEAR_LOG = "DELETE FROM game_log"
+SQL_CLEAR_STATS = (
+    "DELETE FROM stats_size",
+    "DELETE FROM stats_day",
+    "DELETE FROM stats_score",
+)
+
+# Импорт: строки CSV сначала пишутся в import_staging короткими
+# транзакциями, затем переносятся в историю одним запросом
+SQL_STAGE = "INSERT INTO import_staging VALUES (?, ?, ?, ?, ?)"
+SQL_STAGE_CLEAR = "DELETE FROM import_staging"
+SQL_IMPORT = """
+    INSERT INTO game_history (result, score, best_score, timestamp, grid_size)
+    SELECT result, score, best_score, timestamp, grid_size
+    FROM import_staging ORDER BY rowid
+"""
+# Только отсутствующие партии; из повторов внутри файла - первая
+SQL_IMPORT_MERGE = """
+    INSERT INTO game_history (result, score, best_score, timestamp, grid_size)
+    SELECT result, score, best_score, timestamp, grid_size
+    FROM import_staging AS staged
+    WHERE rowid IN (
+        SELECT MIN(rowid) FROM import_staging
+        GROUP BY timestamp, score, result, best_score
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM game_history
+        WHERE timestamp = staged.timestamp AND score = staged.score
+            AND result = staged.result AND best_score = staged.best_score
+    )
+    ORDER BY rowid
+"""
+SQL_LAST_ID = "SELECT COALESCE(MAX(id), 0) FROM game_history"
+# Замена истории: партии, записанные во время импорта, остаются
+SQL_CLEAR_BEFORE = (
+    "DELETE FROM game_history WHERE id <= ?",
+    "DELETE FROM game_log WHERE game_id <= ?",
+)
+SQL_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS game_history_timestamp ON game_history (timestamp)",
+    "CREATE INDEX IF NOT EXISTS game_history_score ON game_history (score)",
+)
+SQL_DROP_INDEXES = (
+    "DROP INDEX game_history_timestamp",
+    "DROP INDEX game_history_score",
+)
+
+# Сводки обновляются при каждой вставке в game_history
+SQL_STATS_TRIGGER = """
+    CREATE TRIGGER stats_insert AFTER INSERT ON game_history
+    BEGIN
+        INSERT INTO stats_size
+        VALUES (
+            COALESCE(NEW.grid_size, 0), 1, NEW.result = 'Выигрыш',
+            NEW.score, NEW.score
+        )
+        ON CONFLICT (grid_size) DO UPDATE SET
+            games = games + 1,
+            wins = wins + excluded.wins,
+            total_score = total_score + excluded.total_score,
+            best_score = MAX(best_score, excluded.best_score);
+
+        INSERT INTO stats_day
+        VALUES (
+            substr(NEW.timestamp, 1, 10), 1, NEW.result = 'Выигрыш',
+            NEW.score, NEW.score
+        )
+        ON CONFLICT (day) DO UPDATE SET
+            games = games + 1,
+            wins = wins + excluded.wins,
+            total_score = total_score + excluded.total_score,
+            best_score = MAX(best_score, excluded.best_score);
+
+        INSERT INTO stats_score VALUES (NEW.score, 1)
+        ON CONFLICT (score) DO UPDATE SET games = games + 1;
+    END
+"""
+SQL_DROP_STATS_TRIGGER = "DROP TRIGGER stats_insert"
+
+# Сводки по партиям с id > ? одним проходом, как сделал бы триггер
+SQL_STATS_ADD = (
+    """
+    INSERT INTO stats_size
+    SELECT COALESCE(grid_size, 0), COUNT(*), SUM(result = 'Выигрыш'),
+        SUM(score), MAX(score)
+    FROM game_history WHERE id > ? GROUP BY 1
+    ON CONFLICT (grid_size) DO UPDATE SET
+        games = games + excluded.games,
+        wins = wins + excluded.wins,
+        total_score = total_score + excluded.total_score,
+        best_score = MAX(best_score, excluded.best_score)
+    """,
+    """
+    INSERT INTO stats_day
+    SELECT substr(timestamp, 1, 10), COUNT(*), SUM(result = 'Выигрыш'),
+        SUM(score), MAX(score)
+    FROM game_history WHERE id > ? GROUP BY 1
+    ON CONFLICT (day) DO UPDATE SET
+        games = games + excluded.games,
+        wins = wins + excluded.wins,
+        total_score = total_score + excluded.total_score,
+        best_score = MAX(best_score, excluded.best_score)
+    """,
+    """
+    INSERT INTO stats_score
+    SELECT score, COUNT(*) FROM game_history WHERE id > ? GROUP BY score
+    ON CONFLICT (score) DO UPDATE SET games = games + excluded.games
+    """,
+)
+
+SQL_STATS_SIZE = """
+    SELECT grid_size, games, wins, total_score, best_score
+    FROM stats_size ORDER BY grid_size
+"""
+SQL_STATS_DAY = """
+    SELECT day, games, wins, total_score, best_score
+    FROM stats_day ORDER BY day DESC LIMIT ?
+"""
+SQL_STATS_SCORE = "SELECT score, games FROM stats_score ORDER BY score"
+
+CSV_HEADERS = ("Результат", "Очки", "Рекорд", "Дата и время", "Размер поля")
+CHUNK = 5000  # Строк в одной транзакции импорта и в шаге прогресса экспорта
+
+SORT_COLUMNS = ("id", "result", "score", "best_score", "timestamp")
+
+# Миграции схемы: версия -> выражения для перехода на неё
+MIGRATIONS = {
+    1: [
+        """
+        CREATE TABLE IF NOT EXISTS game_history (
+            id INTEGER PRIMARY KEY,
+            result TEXT,
+            score INTEGER,
+            best_score INTEGER,
+            timestamp DATETIME
+        )
+        """,
+        # "дд-мм-гггг чч:мм:сс" -> "гггг-мм-дд чч:мм:сс"
+        """
+        UPDATE game_history
+        SET timestamp = substr(timestamp, 7, 4) || '-' || substr(timestamp, 4, 2)
+            || '-' || substr(timestamp, 1, 2) || substr(timestamp, 11)
+        WHERE timestamp LIKE '__-__-____%'
+        """,
+        *SQL_INDEXES,
+    ],
+    # Размер поля партии и сводные таблицы статистики. Сводки обновляются
+    # триггерами при каждой вставке, удаление возможно только целиком
+    # (Storage.clear), поэтому статистика не требует чтения game_history
+    2: [
+        "ALTER TABLE game_history ADD COLUMN grid_size INTEGER",
+        """
+        CREATE TABLE stats_size (
+            grid_size INTEGER PRIMARY KEY,  -- 0: размер неизвестен
+            games INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            total_score INTEGER NOT NULL,
+            best_score INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE stats_day (
+            day TEXT PRIMARY KEY,
+            games INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            total_score INTEGER NOT NULL,
+            best_score INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE stats_score (
+            score INTEGER PRIMARY KEY,
+            games INTEGER NOT NULL
+        )
+        """,
+        SQL_STATS_TRIGGER,
+        # Сводки по уже сохранённым партиям
+        """
+        INSERT INTO stats_size
+        SELECT 0, COUNT(*), SUM(result = 'Выигрыш'), SUM(score), MAX(score)
+        FROM game_history HAVING COUNT(*) > 0
+        """,
+        """
+        INSERT INTO stats_day
+        SELECT substr(timestamp, 1, 10), COUNT(*), SUM(result = 'Выигрыш'),
+            SUM(score), MAX(score)
+        FROM game_history GROUP BY 1
+        """,
+        """
+        INSERT INTO stats_score
+        SELECT score, COUNT(*) FROM game_history GROUP BY score
+        """,
+    ],
+    # Записи ходов (replay.GameLog) отдельно от строк истории,
+    # чтобы чтение страниц таблицы не затрагивало двоичные данные
+    3: [
+        """
+        CREATE TABLE game_log (
+            game_id INTEGER PRIMARY KEY,  -- game_history.id
+            log BLOB NOT NULL
+        )
+        """,
+    ],
+    # Промежуточная таблица импорта CSV (Storage.import_csv)
+    4: [
+        """
+        CREATE TABLE import_staging (
+            result TEXT,
+            score INTEGER,
+            best_score INTEGER,
+            timestamp DATETIME,
+            grid_size INTEGER
+        )
+        """,
+    ],
+}
+
+
+# Текущее время в формате хранения
+def now():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+# Время из хранилища в формате отображения
+def display(timestamp):
+    try:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT).strftime(
+            DISPLAY_FORMAT
+        )
+    except (TypeError, ValueError):
+        return timestamp
+
+
+# Время из CSV (старый или новый формат) в формате хранения
+def parse(timestamp):
+    for time_format in (DISPLAY_FORMAT, TIMESTAMP_FORMAT):
+        try:
+            return datetime.strptime(timestamp, time_format).strftime(
+                TIMESTAMP_FORMAT
+            )
+        except ValueError:
+            pass
+    return timestamp
+
+
+class Storage:
+    def __init__(self, path=DATABASE):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT, cached_statements=256
+        )
+
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA temp_store = MEMORY")
+        self.connection.execute("PRAGMA cache_size = -16000")  # 16 МБ
+
+        self.migrate()
+
+    # Обновление схемы до SCHEMA_VERSION
+    def migrate(self):
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            with self.connection:
+                for statement in MIGRATIONS[target]:
+                    self.connection.execute(statement)
+                self.connection.execute(f"PRAGMA user_version = {target}")
+
+    # Запись одной партии, возвращает id строки.
+    # log - запись ходов партии из replay.GameLog.encode()
+    def add_game(
+        self, result, score, best_score, timestamp=None, grid_size=None, log=None
+    ):
+        with self.connection:
+            cursor = self.connection.execute(
+                SQL_INSERT,
+                (result, score, best_score, timestamp or now(), grid_size),
+            )
+            if log is not None:
+                self.connection.execute(SQL_LOG_INSERT, (cursor.lastrowid, log))
+        return cursor.lastrowid
+
+    # Запись партий одной транзакцией.
+    # Строки: (результат, очки, рекорд, время, размер поля)
+    def add_games(self, rows):
+        with self.connection:
+            self.connection.executemany(SQL_INSERT, rows)
+
+    # Одна партия по id
+    def game(self, row_id):
+        return self.connection.execute(SQL_GAME, (row_id,)).fetchone()
+
+    # Запись ходов партии или None
+    def game_log(self, game_id):
+        row = self.connection.execute(SQL_LOG, (game_id,)).fetchone()
+        return None if row is None else row[0]
+
+    # Все партии в порядке записи (курсор читается по мере обхода)
+    def history(self):
+        return self.connection.execute(SQL_HISTORY)
+
+    # Страница партий после строки с ключом after = (значение, id)
+    def page(self, column, descending, after, limit):
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"Неизвестный столбец: {column}")
+
+        direction = "DESC" if descending else "ASC"
+        query = SQL_SELECT
+        parameters = []
+
+        if after is not None:
+            query += f" WHERE ({column}, id) {'<' if descending else '>'} (?, ?)"
+            parameters.extend(after)
+
+        query += f" ORDER BY {column} {direction}, id {direction} LIMIT ?"
+        parameters.append(limit)
+
+        return self.connection.execute(query, parameters).fetchall()
+
+    def count(self):
+        return self.connection.execute(SQL_COUNT).fetchone()[0]
+
+    def best_score(self):
+        return self.connection.execute(SQL_BEST).fetchone()[0]
+
+    def clear(self):
+        with self.connection:
+            self._clear()
+
+    # Удаление без фиксации: транзакцию открывает вызывающий
+    def _clear(self):
+        self.connection.execute(SQL_CLEAR)
+        self.connection.execute(SQL_CLEAR_LOG)
+        for statement in SQL_CLEAR_STATS:
+            self.connection.execute(statement)
+
+    # Сводная статистика из таблиц stats_*, без чтения game_history
+    def stats(self, days=30):
+        return {
+            "sizes": self.connection.execute(SQL_STATS_SIZE).fetchall(),
+            "days": self.connection.execute(SQL_STATS_DAY, (days,)).fetchall(),
+            "scores": self.connection.execute(SQL_STATS_SCORE).fetchall(),
+        }
+
+    # Импорт из CSV. Строки пишутся в import_staging частями по CHUNK,
+    # каждая часть - своя короткая транзакция, поэтому партии из игры
+    # записываются и во время долгого импорта. Очистка (или отбор
+    # отсутствующих при merge) и перенос в историю - одна транзакция в
+    # конце: при ошибке в любой строке история остаётся прежней.
+    # merge - добавить только отсутствующие партии вместо замены истории.
+    # progress(процент) вызывается после каждой части. Возвращает число
+    # добавленных партий
+    def import_csv(self, csv_path, merge=False, progress=None):
+        try:
+            with self.connection:
+                self.connection.execute(SQL_STAGE_CLEAR)  # Остатки прерванного
+            start_id = self.connection.execute(SQL_LAST_ID).fetchone()[0]
+
+            with open(csv_path, "r", newline="") as csvfile:
+                size = os.fstat(csvfile.fileno()).st_size or 1
+                csv_reader = csv.reader(csvfile)
+                next(csv_reader, None)  # Пропуск первой строки с заголовками
+
+                rows = []
+                for result, score, best_score, timestamp, *grid_size in csv_reader:
+                    rows.append(
+                        (
+                            result,
+                            int(score),
+                            int(best_score),
+                            parse(timestamp),
+                            int(grid_size[0]) if grid_size and grid_size[0] else None,
+                        )
+                    )
+
+                    if len(rows) >= CHUNK:
+                        self._stage_rows(rows)
+                        rows = []
+                        if progress is not None:
+                            progress(min(99, csvfile.buffer.tell() * 100 // size))
+
+                self._stage_rows(rows)
+
+            imported = self._apply_import(merge, start_id)
+        finally:
+            with self.connection:
+                self.connection.execute(SQL_STAGE_CLEAR)
+
+        if progress is not None:
+            progress(100)
+        return imported
+
+    def _stage_rows(self, rows):
+        with self.connection:
+            self.connection.executemany(SQL_STAGE, rows)
+
+    # Перенос из import_staging в историю. Триггер сводок на время
+    # переноса снимается: сводки пересчитываются один раз по новым строкам.
+    # При замене удаляются партии с id <= start_id (записанные до начала
+    # импорта), а индексы строятся заново после вставки - это в разы
+    # быстрее, чем обновлять их по строке, и короче блокировка записи
+    def _apply_import(self, merge, start_id):
+        with self.connection:
+            # Сразу блокировка записи: иначе DROP TRIGGER выполнился бы вне
+            # транзакции, а партия из игры могла бы вклиниться после last_id
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute(SQL_DROP_STATS_TRIGGER)
+
+            if merge:
+                last_id = self.connection.execute(SQL_LAST_ID).fetchone()[0]
+                cursor = self.connection.execute(SQL_IMPORT_MERGE)
+            else:
+                for statement in SQL_DROP_INDEXES:
+                    self.connection.execute(statement)
+                for statement in SQL_CLEAR_BEFORE:
+                    self.connection.execute(statement, (start_id,))
+                for statement in SQL_CLEAR_STATS:
+                    self.connection.execute(statement)
+                last_id = 0  # Сводки заново по всем оставшимся партиям
+                cursor = self.connection.execute(SQL_IMPORT)
+                for statement in SQL_INDEXES:
+                    self.connection.execute(statement)
+
+            self.connection.execute(SQL_STATS_TRIGGER)
+            for statement in SQL_STATS_ADD:
+                self.connection.execute(statement, (last_id,))
+        return cursor.rowcount
+
+    # Экспорт в CSV без загрузки истории в память.
+    # Файл пишется рядом и заменяет прежний только после успешной записи
+    def export_csv(self, csv_path, progress=None):
+        total = self.count() or 1
+        temporary = csv_path + ".tmp"
+        exported = 0
+
+        with open(temporary, "w", newline="") as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(CSV_HEADERS)
+
+            for result, score, best_score, timestamp, grid_size in self.history():
+                csv_writer.writerow(
+                    (
+                        result,
+                        score,
+                        best_score,
+                        display(timestamp),
+                        "" if grid_size is None else grid_size,
+                    )
+                )
+                exported += 1
+                if progress is not None and exported % CHUNK == 0:
+                    progress(min(99, exported * 100 // total))
+
+        os.replace(temporary, csv_path)
+        if progress is not None:
+            progress(100)
+        return exported
+
+    def close(self):
+        self.connection.close()
+        if opened.get(self.path) is self:
+            del opened[self.path]
+
+
+# Медиана по парам (очки, число партий), отсортированным по очкам
+def median(scores):
+    total = sum(games for score, games in scores)
+    if not total:
+        return 0
+
+    # Средние элементы по порядку: low и high (совпадают при нечётном total)
+    low, high = (total - 1) // 2, total // 2
+    low_score = None
+    seen = 0
+    for score, games in scores:
+        seen += games
+        if low_score is None and seen > low:
+            low_score = score
+        if seen > high:
+            return (low_score + score) / 2
+
+
+# Гистограмма очков: [(нижняя граница, число партий)] с равной шириной
+def histogram(scores, buckets=10):
+    if not scores:
+        return []
+
+    width = max(1, -(-(scores[-1][0] + 1) // buckets))
+    counts = [0] * buckets
+    for score, games in scores:
+        counts[min(score // width, buckets - 1)] += games
+    return [(index * width, count) for index, count in enumerate(counts)]
+
+
+opened = {}  # Открытые хранилища по пути к файлу
+
+
+# Общее хранилище для всех частей программы
+def open_storage(path=DATABASE):
+    if path not in opened:
+        opened[path] = Storage(path)
+    return opened[path]
@@ -0,0 +1,213 @@
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+
+import engine
+import storage
+
+# Турнир ботов: M партий на каждую стратегию и размер поля в пуле процессов.
+# Результаты пишутся в game_history пакетными транзакциями.
+#
+#   python tournament.py --games 1000 --policies random greedy corner
+
+GRID_SIZES = tuple(range(engine.GRID_MIN, engine.GRID_MAX + 1))
+CHUNK = 50  # Партий в одной задаче пула
+BATCH = 5000  # Записей в одной транзакции
+
+
+# Случайный ход
+def random_policy(rules, board, rng):
+    return rng.choice(engine.DIRECTIONS)
+
+
+# Ход с наибольшим числом очков
+def greedy_policy(rules, board, rng):
+    best, best_score = None, -1
+    for direction in engine.DIRECTIONS:
+        moved, score = rules.move(board, direction)
+        if moved != board and score > best_score:
+            best, best_score = direction, score
+    return best
+
+
+# Удержание крупных плиток в левом нижнем углу
+def corner_policy(rules, board, rng):
+    for direction in (engine.DOWN, engine.LEFT, engine.RIGHT, engine.UP):
+        if rules.move(board, direction)[0] != board:
+            return direction
+
+
+# Expectimax с коротким лимитом времени
+searcher = None  # Свой экземпляр в каждом процессе пула
+
+
+def expectimax_policy(rules, board, rng):
+    global searcher
+    if searcher is None:
+        import solver
+
+        searcher = solver.Expectimax()
+
+    direction, gain, depth = searcher.search_board(
+        rules.to_cells(board), rules.size, time_limit=0.01, max_depth=2
+    )
+    return direction
+
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "corner": corner_policy,
+    "expectimax": expectimax_policy,
+}
+
+
+# Одна партия по правилам GameView: (результат, очки, ходы).
+# on_move(поле, очки) вызывается после каждого хода; если он вернёт
+# False, партия прерывается с результатом None
+def play_game(policy, rules, rng, on_move=None):
+    board = rules.new_board(rng)
+    score = moves = 0
+
+    while True:
+        if rules.max_exponent(board) >= engine.WIN_EXPONENT:
+            return storage.WIN, score, moves
+        if not rules.moves_available(board):
+            return storage.LOSS, score, moves
+
+        moved, gained = rules.move(board, policy(rules, board, rng))
+        if moved != board:
+            board = rules.add_tile(moved, rng)
+            score += gained
+            moves += 1
+            if on_move is not None and not on_move(board, score):
+                return None, score, moves
+
+
+# Задача пула: серия партий одной стратегии на одном размере поля
+def play_chunk(task):
+    policy_name, size, seeds = task
+    policy = POLICIES[policy_name]
+    rules = engine.rules(size)
+
+    results = []
+    for seed in seeds:
+        result, score, moves = play_game(policy, rules, random.Random(seed))
+        results.append((policy_name, size, result, score, moves))
+    return results
+
+
+# Пакетная запись результатов в историю игр
+class HistoryWriter:
+    def __init__(self, path, batch=BATCH):
+        # Своё соединение: писатель работает и в фоновом потоке (автоигра)
+        # и закрывает его в close
+        self.storage = storage.Storage(path)
+        self.batch = batch
+        self.rows = []
+
+        # Рекорд отмечается так же, как в GameView.update_history
+        self.high_score = self.storage.best_score()
+
+    def add(self, result, score, size):
+        best_score = score if score >= self.high_score else -1
+        self.high_score = max(self.high_score, score)
+
+        self.rows.append((result, score, best_score, storage.now(), size))
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.storage.add_games(self.rows)
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.storage.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Турнир стратегий 2048")
+    parser.add_argument(
+        "--games", type=int, default=100,
+        help="партий на стратегию и размер поля",
+    )
+    parser.add_argument(
+        "--policies", nargs="+", default=["random", "greedy", "corner"],
+        choices=sorted(POLICIES),
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=list(GRID_SIZES),
+        choices=GRID_SIZES,
+    )
+    parser.add_argument(
+        "--processes", type=int, default=multiprocessing.cpu_count()
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--database", default=storage.DATABASE)
+    parser.add_argument(
+        "--no-history", action="store_true",
+        help="не записывать партии в историю игр",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    seeds = random.Random(args.seed)
+
+    tasks = []
+    for policy_name in args.policies:
+        for size in args.sizes:
+            for start in range(0, args.games, CHUNK):
+                count = min(CHUNK, args.games - start)
+                tasks.append(
+                    (
+                        policy_name,
+                        size,
+                        [seeds.getrandbits(64) for _ in range(count)],
+                    )
+                )
+
+    writer = None if args.no_history else HistoryWriter(args.database)
+    summary = {}
+    total_games = total_moves = 0
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        for results in pool.imap_unordered(play_chunk, tasks):
+            for policy_name, size, result, score, moves in results:
+                stats = summary.setdefault(
+                    (policy_name, size), {"games": 0, "wins": 0, "score": 0}
+                )
+                stats["games"] += 1
+                stats["wins"] += result == storage.WIN
+                stats["score"] += score
+
+                total_games += 1
+                total_moves += moves
+                if writer is not None:
+                    writer.add(result, score, size)
+
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"{'Стратегия':<12}{'Поле':>6}{'Партии':>9}{'Победы':>9}{'Ср. счёт':>11}")
+    for (policy_name, size), stats in sorted(summary.items()):
+        print(
+            f"{policy_name:<12}{size:>6}{stats['games']:>9}"
+            f"{stats['wins'] / stats['games']:>9.1%}"
+            f"{stats['score'] / stats['games']:>11.1f}"
+        )
+    print(
+        f"\n{total_games} партий, {total_moves} ходов за {elapsed:.2f} с: "
+        f"{total_games / elapsed:.1f} партий/с, {total_moves / elapsed:.0f} ходов/с"
+    )
+
+
+if __name__ == "__main__":
+    main()
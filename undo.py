@@ -0,0 +1,69 @@
+import sys
+from collections import deque
+
+# Отмена и повтор ходов. Состояние - неизменяемый кортеж из чисел
+# (упакованное поле, счёт, положение записи партии), поэтому шаг истории
+# стоит десятки байт вместо копии сетки объектов Tile.
+# Общий размер состояний ограничен, самые старые вытесняются.
+
+LIMIT = 1024 * 1024  # Предел по умолчанию, байт
+
+
+# Память, занимаемая состоянием с вложенными кортежами
+def state_size(state):
+    if isinstance(state, tuple):
+        return sys.getsizeof(state) + sum(state_size(item) for item in state)
+    return sys.getsizeof(state)
+
+
+class UndoHistory:
+    def __init__(self, limit=LIMIT):
+        self.limit = limit
+        self.undo_states = deque()  # (состояние, размер), старые слева
+        self.redo_states = []
+        self.size = 0  # Байт во всех сохранённых состояниях
+
+    # Состояние перед новым ходом; повтор отменённых ходов становится невозможен
+    def push(self, state):
+        self.size -= sum(size for _, size in self.redo_states)
+        self.redo_states.clear()
+
+        self.undo_states.append((state, state_size(state)))
+        self.size += self.undo_states[-1][1]
+        self.evict()
+
+    # Предыдущее состояние или None; current сохраняется для повтора
+    def undo(self, current):
+        if not self.undo_states:
+            return None
+        state, size = self.undo_states.pop()
+        self.redo_states.append((current, state_size(current)))
+        self.size += self.redo_states[-1][1] - size
+        return state
+
+    # Отменённое состояние или None; current сохраняется для отмены
+    def redo(self, current):
+        if not self.redo_states:
+            return None
+        state, size = self.redo_states.pop()
+        self.undo_states.append((current, state_size(current)))
+        self.size += self.undo_states[-1][1] - size
+        return state
+
+    def set_limit(self, limit):
+        self.limit = limit
+        self.evict()
+
+    # Вытеснение самых старых состояний сверх предела
+    def evict(self):
+        while self.size > self.limit and self.undo_states:
+            state, size = self.undo_states.popleft()
+            self.size -= size
+        while self.size > self.limit and self.redo_states:
+            state, size = self.redo_states.pop(0)  # Самый дальний повтор
+            self.size -= size
+
+    def clear(self):
+        self.undo_states.clear()
+        self.redo_states.clear()
+        self.size = 0